@@ -0,0 +1,129 @@
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette import status
+
+from hashing import HASH_POOL_MAX_QUEUE, HASH_POOL_WORKERS
+
+# Defaults to the hash pool's capacity, so a burst is shed here with 429 before the pool rejects it with 503.
+AUTH_MAX_CONCURRENT = int(os.getenv("AUTH_MAX_CONCURRENT", str(HASH_POOL_WORKERS + HASH_POOL_MAX_QUEUE)))
+AUTH_EMAIL_RATE_PER_MINUTE = float(os.getenv("AUTH_EMAIL_RATE_PER_MINUTE", "5"))
+AUTH_EMAIL_BURST = int(os.getenv("AUTH_EMAIL_BURST", "10"))
+AUTH_IP_RATE_PER_MINUTE = float(os.getenv("AUTH_IP_RATE_PER_MINUTE", "60"))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", "30"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Behind a proxy every request comes from the proxy's address; set this to key on X-Forwarded-For instead.
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# How many proxies in front of the app append to X-Forwarded-For; entries left of theirs come from the client.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+
+class RateLimitStore(ABC):
+    """Token buckets keyed by string. Behind several instances the buckets must live in one store, or each
+    instance admits its own burst for the same key."""
+
+    @abstractmethod
+    async def take(self, key: str, rate_per_second: float, burst: int) -> float:
+        """Takes one token from `key`'s bucket; returns 0 if admitted, else seconds until a token is available."""
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate_per_second: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate_per_second)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / rate_per_second
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+    async def clear(self):
+        self.buckets.clear()
+
+
+class AdmissionController:
+    """Sheds auth requests with 429 before any hashing: first on in-process concurrency, then on per-IP
+    and per-email token buckets."""
+
+    def __init__(self, store: RateLimitStore, max_concurrent: int, email_rate_per_minute: float, email_burst: int,
+                 ip_rate_per_minute: float, ip_burst: int):
+        self.store = store
+        self.max_concurrent = max_concurrent
+        self.limits = {
+            "ip": (ip_rate_per_minute / 60, ip_burst),
+            "email": (email_rate_per_minute / 60, email_burst),
+        }
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {"concurrency": 0, "ip": 0, "email": 0}
+
+    @asynccontextmanager
+    async def admit(self, ip: Optional[str], email: str):
+        if self.in_flight >= self.max_concurrent:
+            self.reject("concurrency", 1)
+        for scope, value in (("ip", ip), ("email", email.strip().lower())):
+            if value is None:
+                continue
+            rate_per_second, burst = self.limits[scope]
+            retry_after = await self.store.take(f"{scope}:{value}", rate_per_second, burst)
+            if retry_after:
+                self.reject(scope, retry_after)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def reject(self, reason: str, retry_after: float):
+        self.shed[reason] += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    async def clear(self):
+        await self.store.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+def client_ip(request) -> Optional[str]:
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUST_FORWARDED_FOR and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        return hops[max(len(hops) - TRUSTED_PROXY_HOPS, 0)]
+    return request.client.host if request.client else None
+
+
+auth_admission = AdmissionController(
+    InMemoryRateLimitStore(RATE_LIMIT_MAX_KEYS), AUTH_MAX_CONCURRENT, AUTH_EMAIL_RATE_PER_MINUTE, AUTH_EMAIL_BURST,
+    AUTH_IP_RATE_PER_MINUTE, AUTH_IP_BURST
+)
@@ -0,0 +1,33 @@
+"""add owner scoped indexes on todos table
+
+Revision ID: 3f1c9a7d2b64
+Revises: 8bae60fa8edf
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b64'
+down_revision: Union[str, None] = '8bae60fa8edf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction on Postgres.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_owner_id_id', 'todos', ['owner_id', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_todos_owner_id_completed_priority', 'todos', ['owner_id', 'completed', 'priority'],
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_owner_id_completed_priority', table_name='todos',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_todos_owner_id_id', table_name='todos', postgresql_concurrently=True)
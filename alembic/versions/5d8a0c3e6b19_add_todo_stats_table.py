@@ -0,0 +1,39 @@
+"""add todo_stats counters table
+
+Revision ID: 5d8a0c3e6b19
+Revises: c41e7b9f05a2
+Create Date: 2026-10-18 15:20:44.913027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8a0c3e6b19'
+down_revision: Union[str, None] = 'c41e7b9f05a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'todo_stats',
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('completed', sa.Boolean(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('owner_id', 'priority', 'completed'),
+    )
+    op.execute(
+        "INSERT INTO todo_stats (owner_id, priority, completed, count) "
+        "SELECT owner_id, priority, completed, COUNT(*) FROM todos "
+        "WHERE owner_id IS NOT NULL AND priority IS NOT NULL AND completed IS NOT NULL "
+        "GROUP BY owner_id, priority, completed"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('todo_stats')
@@ -0,0 +1,30 @@
+"""add version columns on users and todos table
+
+Revision ID: a6d2e4f81c37
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-18 11:02:17.284506
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d2e4f81c37'
+down_revision: Union[str, None] = '3f1c9a7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('users', sa.Column('todos_version', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('todos', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    op.drop_column('todos', 'version')
+    op.drop_column('users', 'todos_version')
+    op.drop_column('users', 'version')
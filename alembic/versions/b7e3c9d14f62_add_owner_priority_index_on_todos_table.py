@@ -0,0 +1,29 @@
+"""add owner priority index on todos table
+
+Revision ID: b7e3c9d14f62
+Revises: f3b9d2a7c5e8
+Create Date: 2026-10-18 19:24:08.316472
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c9d14f62'
+down_revision: Union[str, None] = 'f3b9d2a7c5e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction on Postgres.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_owner_id_priority_id', 'todos', ['owner_id', 'priority', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_owner_id_priority_id', table_name='todos', postgresql_concurrently=True)
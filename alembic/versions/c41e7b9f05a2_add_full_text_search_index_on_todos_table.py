@@ -0,0 +1,54 @@
+"""add full text search index on todos table
+
+Revision ID: c41e7b9f05a2
+Revises: a6d2e4f81c37
+Create Date: 2026-10-18 12:26:03.917442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7b9f05a2'
+down_revision: Union[str, None] = 'a6d2e4f81c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE todos ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                   "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED")
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY ix_todos_search_vector ON todos USING gin (search_vector)")
+        return
+
+    op.execute("CREATE VIRTUAL TABLE todos_fts USING fts5(owner, title, description, content='')")
+    op.execute("CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+               "INSERT INTO todos_fts(rowid, owner, title, description) "
+               "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END")
+    op.execute("CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+               "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+               "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); END")
+    op.execute("CREATE TRIGGER todos_fts_au AFTER UPDATE OF owner_id, title, description ON todos BEGIN "
+               "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+               "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); "
+               "INSERT INTO todos_fts(rowid, owner, title, description) "
+               "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END")
+    op.execute("INSERT INTO todos_fts(rowid, owner, title, description) "
+               "SELECT id, 'owner' || owner_id, title, description FROM todos")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_todos_search_vector")
+        op.drop_column('todos', 'search_vector')
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS todos_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS todos_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS todos_fts_ai")
+    op.execute("DROP TABLE IF EXISTS todos_fts")
@@ -0,0 +1,52 @@
+"""make priority not null on todos table
+
+Revision ID: d2a8f5c7e913
+Revises: b7e3c9d14f62
+Create Date: 2026-10-18 20:41:17.582903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f5c7e913'
+down_revision: Union[str, None] = 'b7e3c9d14f62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rebuilding todos on SQLite drops its triggers, so the full-text search ones are created again.
+SQLITE_FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF owner_id, title, description ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); "
+    "INSERT INTO todos_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END",
+]
+
+
+def upgrade() -> None:
+    # The API has always required a priority of 1-5, so only rows written behind its back are NULL; they
+    # become the lowest priority. Run `python -m stats` afterwards to count them in todo_stats.
+    op.execute("UPDATE todos SET priority = 1 WHERE priority IS NULL")
+    with op.batch_alter_table('todos') as batch_op:
+        batch_op.alter_column('priority', existing_type=sa.Integer(), nullable=False)
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('todos') as batch_op:
+        batch_op.alter_column('priority', existing_type=sa.Integer(), nullable=True)
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
@@ -0,0 +1,50 @@
+"""add todo change feed columns and todo_tombstones table
+
+Revision ID: f3b9d2a7c5e8
+Revises: 8e2f6a4c1d07
+Create Date: 2026-10-18 18:03:51.207664
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b9d2a7c5e8'
+down_revision: Union[str, None] = '8e2f6a4c1d07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('changes_floor', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('todos', sa.Column('changed_version', sa.Integer(), nullable=False, server_default='0'))
+    # Existing rows count as written at their owner's current version, so the first delta sync is empty.
+    op.execute(
+        "UPDATE todos SET changed_version = COALESCE("
+        "(SELECT users.todos_version FROM users WHERE users.id = todos.owner_id), 0)"
+    )
+    op.create_index('ix_todos_owner_id_changed_version', 'todos', ['owner_id', 'changed_version'])
+    op.create_table(
+        'todo_tombstones',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('todo_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_todo_tombstones_id', 'todo_tombstones', ['id'])
+    op.create_index('ix_todo_tombstones_deleted_at', 'todo_tombstones', ['deleted_at'])
+    op.create_index('ix_todo_tombstones_owner_id_version', 'todo_tombstones', ['owner_id', 'version'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todo_tombstones_owner_id_version', table_name='todo_tombstones')
+    op.drop_index('ix_todo_tombstones_deleted_at', table_name='todo_tombstones')
+    op.drop_index('ix_todo_tombstones_id', table_name='todo_tombstones')
+    op.drop_table('todo_tombstones')
+    op.drop_index('ix_todos_owner_id_changed_version', table_name='todos')
+    op.drop_column('todos', 'changed_version')
+    op.drop_column('users', 'changes_floor')
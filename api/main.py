@@ -1,13 +1,43 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from mangum import Mangum
 
-from database import engine
+from database import DB_SCHEMA_MODE, SERVERLESS, QueryTrackingMiddleware, dispose_engine, get_engine
+from hashing import hashing_policy
 from models import Base
+from timing import ServerTimingMiddleware, TimedORJSONResponse, phase_histograms
 from routers import auth, todos, admin, user
 
-app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+started = False
+
+
+async def startup():
+    """One-time process setup, run by the lifespan under a server and before the first request under Mangum."""
+    global started
+    if started:
+        return
+    hashing_policy.configure()
+    if DB_SCHEMA_MODE == "create_all":
+        async with get_engine().begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    started = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    # A serverless instance is frozen between invocations, not shut down; keep its warm connection.
+    if not SERVERLESS:
+        await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedORJSONResponse)
+app.add_middleware(QueryTrackingMiddleware)
+app.add_middleware(ServerTimingMiddleware)
 
 
 @app.get("/")
@@ -33,9 +63,22 @@ async def healthy():
     return {"message": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(phase_histograms.render(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(auth.router)
 app.include_router(todos.router)
 app.include_router(admin.router)
 app.include_router(user.router)
 
-mangum = Mangum(app)
+
+async def serverless_app(scope, receive, send):
+    if scope["type"] == "http":
+        await startup()
+    await app(scope, receive, send)
+
+
+# Mangum would run the lifespan around every invocation, disposing the engine each time.
+mangum = Mangum(serverless_app, lifespan="off")
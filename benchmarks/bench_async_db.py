@@ -0,0 +1,146 @@
+"""Concurrent-request throughput of GET /todos/ with a blocking vs. an async session.
+
+"before" replays the original handler shape (``async def`` + synchronous ``Session``),
+"after" mounts the real ``routers.todos`` router on an ``AsyncSession``. Both read the
+same SQLite file. ``--latency-ms`` adds a per-statement delay in the driver thread to
+stand in for the network round trip to a database server.
+
+    python -m benchmarks.bench_async_db --rows 10000 --latency-ms 20 --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Annotated
+
+from fastapi import Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import Base, get_db, get_read_db
+from models import Todos
+from routers import todos
+from routers.auth import get_current_user
+
+
+def seed(sync_engine, rows: int, owners: int):
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(insert(Todos), [
+            {
+                "title": f"todo {i}",
+                "description": "benchmark row",
+                "priority": i % 5 + 1,
+                "completed": i % 2 == 0,
+                "owner_id": i % owners + 1,
+            }
+            for i in range(rows)
+        ])
+
+
+def add_latency(sync_engine, latency_ms: float, run_async: bool = False):
+    def simulate_round_trip(statement):
+        time.sleep(latency_ms / 1000)
+
+    @event.listens_for(sync_engine, "connect")
+    def set_trace_callback(dbapi_connection, connection_record):
+        if run_async:
+            dbapi_connection.run_async(lambda conn: conn.set_trace_callback(simulate_round_trip))
+        else:
+            dbapi_connection.set_trace_callback(simulate_round_trip)
+
+
+def override_get_current_user():
+    return {"email": "bench@example.com", "user_id": 1, "role": "admin"}
+
+
+def build_before_app(sync_engine):
+    SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+
+    def get_sync_db():
+        db = SyncSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.get("/todos/")
+    async def get_todos(db: Annotated[Session, Depends(get_sync_db)],
+                        user: Annotated[dict, Depends(override_get_current_user)]):
+        return db.query(Todos).filter(Todos.owner_id == user.get('user_id')).all()
+
+    return app
+
+
+def build_after_app(async_engine):
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(todos.router)
+    app.dependency_overrides[get_db] = get_async_db
+    app.dependency_overrides[get_read_db] = get_async_db
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    return app
+
+
+async def drive(app, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/todos/")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        await client.get("/todos/")
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "throughput_rps": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sync_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False},
+                                pool_size=args.concurrency)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.concurrency)
+    seed(sync_engine, args.rows, args.owners)
+    add_latency(sync_engine, args.latency_ms)
+    add_latency(async_engine.sync_engine, args.latency_ms, run_async=True)
+
+    for name, app in (("before (sync Session)", build_before_app(sync_engine)),
+                      ("after (AsyncSession)", build_after_app(async_engine))):
+        result = await drive(app, args.requests, args.concurrency)
+        print(f"{name:<24} {result['throughput_rps']:8.1f} req/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  max {result['max_ms']:7.1f} ms")
+
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--owners", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
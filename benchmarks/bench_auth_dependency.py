@@ -0,0 +1,34 @@
+"""Cost of the get_current_user dependency with and without the verified-token cache.
+
+    python -m benchmarks.bench_auth_dependency --calls 20000
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+from routers.auth import create_access_token, get_current_user, verified_token_cache
+
+
+async def time_calls(token: str, calls: int, cached: bool) -> float:
+    verified_token_cache.clear()
+    started = time.perf_counter()
+    for _ in range(calls):
+        if not cached:
+            verified_token_cache.clear()
+        await get_current_user(token=token)
+    return (time.perf_counter() - started) / calls
+
+
+async def main(args):
+    token = create_access_token("bench@example.com", 1, "user", timedelta(minutes=10))
+    uncached = await time_calls(token, args.calls, cached=False)
+    cached = await time_calls(token, args.calls, cached=True)
+    print(f"jwt.decode every call   {uncached * 1e6:8.1f} us/call")
+    print(f"verified-token cache    {cached * 1e6:8.1f} us/call  ({uncached / cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20_000)
+    asyncio.run(main(parser.parse_args()))
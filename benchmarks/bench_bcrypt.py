@@ -0,0 +1,38 @@
+"""bcrypt hash and verify time per cost level, and the cost BCRYPT_TARGET_MS would calibrate to here.
+
+    python -m benchmarks.bench_bcrypt --min-rounds 8 --max-rounds 14 --target-ms 250
+"""
+import argparse
+import statistics
+import time
+
+from hashing import calibrate_rounds, hash_password, verify_password
+
+
+def median_seconds(fn, *args, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main(args):
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        hashed_password = hash_password("bench-password", rounds)
+        hash_seconds = median_seconds(hash_password, "bench-password", rounds, repeat=args.repeat)
+        verify_seconds = median_seconds(verify_password, "bench-password", hashed_password, repeat=args.repeat)
+        print(f"rounds {rounds:>2}  hash {hash_seconds * 1000:8.1f} ms  verify {verify_seconds * 1000:8.1f} ms  "
+              f"{1 / verify_seconds:7.1f} logins/s per core")
+    rounds = calibrate_rounds(args.target_ms / 1000, args.min_rounds, args.max_rounds)
+    print(f"BCRYPT_TARGET_MS={args.target_ms:g} calibrates to rounds {rounds}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
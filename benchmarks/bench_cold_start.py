@@ -0,0 +1,80 @@
+"""Import-to-first-response time of a fresh interpreter, per DB_SCHEMA_MODE.
+
+Every trial runs in a new process: import api.main, run the lifespan, serve one
+request through httpx's ASGI transport. The schema is created up front, as a
+deployment that runs Alembic would have it.
+
+    python -m benchmarks.bench_cold_start --trials 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(path: str):
+    started = time.perf_counter()
+    import asyncio
+    from httpx import ASGITransport, AsyncClient
+    from api.main import app
+    imported = time.perf_counter()
+
+    async def first_response():
+        async with app.router.lifespan_context(app):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                headers = {"Authorization": f"Bearer {os.environ['BENCH_TOKEN']}"}
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+                return time.perf_counter()
+
+    responded = asyncio.run(first_response())
+    print(json.dumps({"import_ms": (imported - started) * 1000, "first_response_ms": (responded - started) * 1000}))
+
+
+def run_trials(path: str, schema_mode: str, trials: int, env: dict) -> dict:
+    results = []
+    for _ in range(trials):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", path],
+            env={**env, "DB_SCHEMA_MODE": schema_mode}, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return {
+        "import_ms": statistics.median(result["import_ms"] for result in results),
+        "first_response_ms": statistics.median(result["first_response_ms"] for result in results),
+    }
+
+
+def main(args):
+    database_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database_path}"}
+    os.environ.update(env)
+
+    from datetime import timedelta
+    from sqlalchemy import create_engine
+    from models import Base
+    from routers.auth import create_access_token
+
+    Base.metadata.create_all(bind=create_engine(env["DATABASE_URL"]))
+    env["BENCH_TOKEN"] = create_access_token("bench@example.com", 1, "user", timedelta(minutes=10))
+
+    for path in ("/healthy", "/todos/"):
+        for schema_mode in ("create_all", "alembic"):
+            result = run_trials(path, schema_mode, args.trials, env)
+            print(f"{path:<10} DB_SCHEMA_MODE={schema_mode:<11} import {result['import_ms']:7.1f} ms  "
+                  f"first response {result['first_response_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--child", metavar="PATH")
+    parsed = parser.parse_args()
+    if parsed.child:
+        child(parsed.child)
+    else:
+        main(parsed)
@@ -0,0 +1,174 @@
+"""Latency and throughput of the main endpoints against a seeded dataset, driven through httpx's ASGI transport.
+
+Seeds --users users and --todos todos into a fresh SQLite file, then fires --requests requests per
+endpoint with --concurrency in flight and reports p50/p95/p99 latency and requests per second.
+Results are written as JSON; pass an earlier file to --compare to see the change between commits.
+Latencies include every response, so login 503s from a saturated hash pool (HASH_POOL_*) show up in
+its status counts rather than being dropped. Every request comes from one client address, so the auth
+admission limits (AUTH_*) are raised out of the way unless set in the environment.
+
+    python -m benchmarks.bench_load --users 1000 --todos 100000 --output load.json
+    python -m benchmarks.bench_load --users 1000 --todos 100000 --compare load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+for name in ("AUTH_MAX_CONCURRENT", "AUTH_EMAIL_RATE_PER_MINUTE", "AUTH_EMAIL_BURST", "AUTH_IP_RATE_PER_MINUTE",
+             "AUTH_IP_BURST"):
+    os.environ.setdefault(name, "1000000")
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, insert
+
+from api.main import app
+from hashing import hash_password
+from models import Base, Todos, User
+from routers.auth import create_access_token
+
+PASSWORD = "bench-password"
+
+
+def seed(users: int, todos: int, batch: int = 50_000):
+    sync_engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(bind=sync_engine)
+    generator = random.Random(42)
+    hashed_password = hash_password(PASSWORD)
+    with sync_engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"email": f"user{i}@example.com", "username": f"user{i}", "first_name": "Bench", "last_name": str(i),
+             "hashed_password": hashed_password, "role": "admin" if i == 1 else "user", "phone_number": "0"}
+            for i in range(1, users + 1)
+        ])
+        for start in range(0, todos, batch):
+            conn.execute(insert(Todos), [
+                {"title": f"Todo {i}", "description": f"Seeded todo number {i}", "priority": generator.randint(1, 5),
+                 "completed": generator.random() < 0.5, "owner_id": generator.randint(1, users)}
+                for i in range(start, min(start + batch, todos))
+            ])
+    sync_engine.dispose()
+
+
+def bearer(user_id: int) -> dict:
+    token = create_access_token(f"user{user_id}@example.com", user_id, "admin" if user_id == 1 else "user",
+                                timedelta(hours=1))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def endpoints(users: int, generator: random.Random) -> dict:
+    """Each entry builds the keyword arguments of one client.request call."""
+    def list_todos():
+        return {"method": "GET", "url": "/todos/", "headers": bearer(generator.randint(1, users))}
+
+    def filtered_todos():
+        return {"method": "GET", "url": "/todos/", "headers": bearer(generator.randint(1, users)),
+                "params": {"completed": "false", "min_priority": 3, "sort": "priority"}}
+
+    def login():
+        return {"method": "POST", "url": "/auth/login",
+                "data": {"username": f"user{generator.randint(1, users)}@example.com", "password": PASSWORD}}
+
+    def admin_todos():
+        return {"method": "GET", "url": "/admin/todos", "headers": bearer(1),
+                "params": {"limit": 200}}
+
+    return {
+        "GET /todos/": list_todos,
+        "GET /todos/?completed&priority&sort": filtered_todos,
+        "POST /auth/login": login,
+        "GET /admin/todos": admin_todos,
+    }
+
+
+async def drive(client: AsyncClient, build_request, requests: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            kwargs = build_request()
+            started = time.perf_counter()
+            response = await client.request(**kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "statuses": statuses,
+        "throughput_rps": requests / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict, baseline: dict):
+    for name, result in results["endpoints"].items():
+        line = (f"{name:<38} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f} req/s  {result['statuses']}")
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous:
+            line += (f"  (p95 {(result['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%, "
+                     f"req/s {(result['throughput_rps'] / previous['throughput_rps'] - 1) * 100:+.1f}% "
+                     f"vs {baseline.get('commit')})")
+        print(line)
+
+
+async def main(args):
+    started = time.perf_counter()
+    seed(args.users, args.todos)
+    print(f"seeded {args.users} users and {args.todos} todos in {time.perf_counter() - started:.1f}s")
+
+    generator = random.Random(7)
+    results = {"commit": git_commit(), "config": vars(args), "endpoints": {}}
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            for name, build_request in endpoints(args.users, generator).items():
+                if args.endpoint and args.endpoint not in name:
+                    continue
+                results["endpoints"][name] = await drive(client, build_request, args.requests, args.concurrency)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--todos", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--endpoint", help="only run endpoints whose name contains this")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""GET /todos/search query cost: FTS index vs. LIKE '%q%' scan, on a seeded SQLite file.
+
+One "power user" owns --owner-rows todos; the remaining rows are spread across other owners.
+
+    python -m benchmarks.bench_search --rows 1000000 --owner-rows 50000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, or_, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, Todos
+from search import search_todos
+
+VOCABULARY = [f"word{i}" for i in range(20_000)]
+# Zipf-like weights: a handful of very common words and a long tail of rare ones.
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+QUERIES = ("word50", "word500", "word5000", "word19999", "word10 word200")
+
+
+def seed(sync_engine, rows: int, owner_rows: int, batch: int = 50_000):
+    Base.metadata.create_all(bind=sync_engine)
+    generator = random.Random(42)
+    with sync_engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(insert(Todos), [
+                {
+                    "title": " ".join(generator.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=3)),
+                    "description": " ".join(generator.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=8)),
+                    "priority": generator.randint(1, 5),
+                    "completed": generator.random() < 0.5,
+                    "owner_id": 1 if i < owner_rows else generator.randint(2, 1000),
+                }
+                for i in range(start, min(start + batch, rows))
+            ])
+
+
+async def time_queries(run, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            await run(q)
+    return (time.perf_counter() - started) / (repeat * len(QUERIES))
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    started = time.perf_counter()
+    seed(create_engine(f"sqlite:///{path}"), args.rows, args.owner_rows)
+    print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with async_sessionmaker(bind=async_engine)() as db:
+        async def like_scan(q):
+            statement = select(Todos).where(Todos.owner_id == 1)
+            for term in q.split():
+                pattern = f"%{term}%"
+                statement = statement.where(or_(Todos.title.like(pattern), Todos.description.like(pattern)))
+            result = await db.execute(statement.order_by(Todos.id).limit(args.limit))
+            return result.scalars().all()
+
+        async def fts(q):
+            return await search_todos(db, 1, q, None, args.limit)
+
+        like_seconds = await time_queries(like_scan, args.repeat)
+        fts_seconds = await time_queries(fts, args.repeat)
+    await async_engine.dispose()
+
+    print(f"LIKE '%q%' scan   {like_seconds * 1000:8.2f} ms/query")
+    print(f"FTS5 + bm25       {fts_seconds * 1000:8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--owner-rows", type=int, default=5_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
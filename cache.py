@@ -0,0 +1,173 @@
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+TODO_CACHE_MAX_OWNERS = int(os.getenv("TODO_CACHE_MAX_OWNERS", "1024"))
+TODO_CACHE_MAX_PAGES_PER_OWNER = int(os.getenv("TODO_CACHE_MAX_PAGES_PER_OWNER", "16"))
+TODO_CACHE_TTL_SECONDS = float(os.getenv("TODO_CACHE_TTL_SECONDS", "30"))
+TODO_CACHE_MAX_BYTES = int(os.getenv("TODO_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))
+
+
+class CacheBackend(ABC):
+    """Storage for serialized pages grouped by owner, so one write can drop every cached page of its owner."""
+
+    @abstractmethod
+    async def get(self, owner_id: int, page_key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, owner_id: int, page_key: str, value: bytes):
+        ...
+
+    @abstractmethod
+    async def invalidate(self, owner_id: int):
+        ...
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process LRU of owners, each holding an LRU of pages; bounded by owner count, pages per owner and the
+    total size of the cached pages."""
+
+    def __init__(self, max_owners: int, max_pages_per_owner: int, ttl_seconds: float,
+                 max_bytes: int = TODO_CACHE_MAX_BYTES):
+        self.max_owners = max_owners
+        self.max_pages_per_owner = max_pages_per_owner
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[int, tuple[float, OrderedDict[str, bytes]]] = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def drop(self, owner_id: int):
+        entry = self.entries.pop(owner_id, None)
+        if entry is not None:
+            self.size -= sum(len(value) for value in entry[1].values())
+
+    async def get(self, owner_id: int, page_key: str) -> Optional[bytes]:
+        entry = self.entries.get(owner_id)
+        if entry is None:
+            return None
+        expires_at, pages = entry
+        if expires_at <= time.monotonic():
+            self.drop(owner_id)
+            return None
+        self.entries.move_to_end(owner_id)
+        return pages.get(page_key)
+
+    async def set(self, owner_id: int, page_key: str, value: bytes):
+        entry = self.entries.get(owner_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.drop(owner_id)
+            entry = (time.monotonic() + self.ttl_seconds, OrderedDict())
+            self.entries[owner_id] = entry
+        self.entries.move_to_end(owner_id)
+        pages = entry[1]
+        self.size += len(value) - len(pages.get(page_key, b""))
+        pages[page_key] = value
+        pages.move_to_end(page_key)
+        while len(pages) > self.max_pages_per_owner:
+            self.size -= len(pages.popitem(last=False)[1])
+        while len(self.entries) > self.max_owners or (self.size > self.max_bytes and len(self.entries) > 1):
+            self.drop(next(iter(self.entries)))
+            self.evictions += 1
+        # Only this owner is left; shed its oldest pages, down to none if `value` alone is over budget.
+        while self.size > self.max_bytes and pages:
+            self.size -= len(pages.popitem(last=False)[1])
+            self.evictions += 1
+        if not pages:
+            del self.entries[owner_id]
+
+    async def invalidate(self, owner_id: int):
+        self.drop(owner_id)
+
+    async def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class TodoListCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, owner_id: int, page_key: str) -> Optional[bytes]:
+        value = await self.backend.get(owner_id, page_key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, owner_id: int, page_key: str, value: bytes):
+        await self.backend.set(owner_id, page_key, value)
+
+    async def invalidate(self, owner_id: int):
+        self.invalidations += 1
+        await self.backend.invalidate(owner_id)
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+class VerifiedTokenCache:
+    """LRU of decoded JWT principals keyed by token digest; each entry lives until the token's `exp`."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def set(self, token: str, principal: dict, expires_at: float):
+        key = hashlib.sha256(token.encode()).digest()
+        self.entries[key] = (expires_at, dict(principal))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+todo_list_cache = TodoListCache(
+    InMemoryCacheBackend(TODO_CACHE_MAX_OWNERS, TODO_CACHE_MAX_PAGES_PER_OWNER, TODO_CACHE_TTL_SECONDS,
+                         TODO_CACHE_MAX_BYTES)
+)
+
+verified_token_cache = VerifiedTokenCache(TOKEN_CACHE_MAX_ENTRIES)
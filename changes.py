@@ -0,0 +1,140 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from models import Todos, TodoTombstone, User
+from pagination import cursor_values, encode_cursor, keyset_after
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+
+async def record_tombstones(db: AsyncSession, owner_id: int, todo_ids: Iterable[int], version: int):
+    deleted_at = datetime.now(timezone.utc)
+    await db.execute(insert(TodoTombstone).values([
+        {"owner_id": owner_id, "todo_id": todo_id, "version": version, "deleted_at": deleted_at}
+        for todo_id in todo_ids
+    ]))
+
+
+async def get_changes(db: AsyncSession, owner_id: int, since: Optional[int], cursor: Optional[str],
+                      limit: int) -> dict:
+    """Todos written and deleted after version `since`, up to the returned version, `limit` entries per page.
+    Without `since`, pages through every todo instead."""
+    if since is None:
+        return await get_full_sync(db, owner_id, cursor, limit)
+    result = await db.execute(select(User.todos_version, User.changes_floor).where(User.id == owner_id))
+    version, changes_floor = result.first() or (0, 0)
+
+    # Written rows and tombstones share the owner's version space, so both are paged on (version, id). The
+    # cursor also carries the version the first page read, so every page is bounded by the same one.
+    changed_keys = {"changed_version": Todos.changed_version, "id": Todos.id}
+    deleted_keys = {"changed_version": TodoTombstone.version, "id": TodoTombstone.todo_id}
+    if cursor is None:
+        position = since
+        changed_after = Todos.changed_version > since
+        deleted_after = TodoTombstone.version > since
+    else:
+        values = cursor_values(cursor, ("version", "changed_version", "id"))
+        version, position = values["version"], values["changed_version"]
+        changed_after = keyset_after(changed_keys, values)
+        deleted_after = keyset_after(deleted_keys, values)
+    if position < changes_floor:
+        raise HTTPException(status_code=status.HTTP_410_GONE,
+                            detail="Changes since this version were compacted, sync without since")
+
+    changed = await db.execute(
+        select(Todos)
+        .where(Todos.owner_id == owner_id)
+        .where(changed_after)
+        .where(Todos.changed_version <= version)
+        .order_by(*changed_keys.values())
+        .limit(limit + 1)
+    )
+    deleted = await db.execute(
+        select(*deleted_keys.values())
+        .where(TodoTombstone.owner_id == owner_id)
+        .where(deleted_after)
+        .where(TodoTombstone.version <= version)
+        .order_by(*deleted_keys.values())
+        .limit(limit + 1)
+    )
+    entries = sorted(
+        [((todo.changed_version, todo.id), todo) for todo in changed.scalars().all()]
+        + [((tombstone_version, todo_id), None) for tombstone_version, todo_id in deleted.all()],
+        key=lambda entry: entry[0]
+    )
+    page = entries[:limit]
+    next_cursor = None
+    if len(entries) > limit:
+        (last_version, last_id), _ = page[-1]
+        next_cursor = encode_cursor({"version": version, "changed_version": last_version, "id": last_id})
+
+    changed = sorted((todo for _, todo in page if todo is not None), key=lambda todo: todo.id)
+    # SQLite can reuse the id of a deleted todo; a live row wins over an older tombstone.
+    changed_ids = {todo.id for todo in changed}
+    deleted_ids = {todo_id for (_, todo_id), todo in page if todo is None}
+    # Until the last page, `version` stays at `since`, so a client that stops early resumes from there.
+    return {"version": since if next_cursor else version, "changed": changed,
+            "deleted": sorted(deleted_ids - changed_ids), "next_cursor": next_cursor}
+
+
+async def get_full_sync(db: AsyncSession, owner_id: int, cursor: Optional[str], limit: int) -> dict:
+    """One page of the owner's todos as of the version the first page read. The cursor carries that version, so
+    rows written while the client pages are left out here and returned by the next sync from `version`."""
+    statement = select(Todos).where(Todos.owner_id == owner_id)
+    if cursor is None:
+        result = await db.execute(select(User.todos_version).where(User.id == owner_id))
+        version = result.scalar() or 0
+    else:
+        values = cursor_values(cursor, ("id", "version"))
+        version = values["version"]
+        statement = statement.where(keyset_after({"id": Todos.id}, values))
+    result = await db.execute(
+        statement.where(Todos.changed_version <= version).order_by(Todos.id).limit(limit + 1)
+    )
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor({"id": rows[limit - 1].id, "version": version})
+    return {"version": version, "changed": rows[:limit], "deleted": [], "next_cursor": next_cursor}
+
+
+async def compact_tombstones(db: AsyncSession, retention: timedelta = timedelta(days=TOMBSTONE_RETENTION_DAYS)) -> int:
+    """Deletes tombstones older than `retention`, first raising each affected owner's changes_floor past them.
+    Versions only grow, so the newest expired tombstone is always at or above the current floor."""
+    cutoff = datetime.now(timezone.utc) - retention
+    expired = TodoTombstone.deleted_at < cutoff
+    newest_expired = (
+        select(func.max(TodoTombstone.version))
+        .where(TodoTombstone.owner_id == User.id)
+        .where(expired)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(User)
+        .where(exists().where(TodoTombstone.owner_id == User.id).where(expired))
+        .values(changes_floor=newest_expired)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(delete(TodoTombstone).where(expired).execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount
+
+
+async def main():
+    from database import SessionLocal, dispose_engine, get_engine
+    get_engine()
+    async with SessionLocal() as db:
+        removed = await compact_tombstones(db)
+    await dispose_engine()
+    print(f"{removed} tombstones compacted")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,417 @@
+import base64
+import json
+import logging
 import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from timing import record_phase
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+# Comma-separated read replicas; read-only handlers use them, everything else uses DATABASE_URL.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a write, the same caller reads from the primary for this long so it sees its own changes.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+REPLICA_MAX_STICKY_KEYS = int(os.getenv("REPLICA_MAX_STICKY_KEYS", "100000"))
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE", "serverless" if SERVERLESS else "server")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "1" if DB_POOL_PROFILE == "serverless" else "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "0" if DB_POOL_PROFILE == "serverless" else "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300" if DB_POOL_PROFILE == "serverless" else "1800"))
+DB_POOL_SLOW_CHECKOUT_SECONDS = float(os.getenv("DB_POOL_SLOW_CHECKOUT_SECONDS", "0.5"))
+DB_SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_SECONDS", "0.2"))
+# A request running the same statement shape more than this many times is logged as a likely N+1.
+DB_REPEATED_QUERY_THRESHOLD = int(os.getenv("DB_REPEATED_QUERY_THRESHOLD", "10"))
+# "alembic" leaves the schema to migrations; "create_all" creates missing tables at startup.
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "alembic" if SERVERLESS else "create_all")
+
+
+def get_async_database_url(url: str) -> str:
+    database_url = make_url(url)
+    driver = ASYNC_DRIVERS.get(database_url.get_backend_name())
+    if driver is None:
+        return database_url.render_as_string(hide_password=False)
+    return database_url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def get_pool_options(profile: str) -> dict:
+    if profile == "serverless":
+        # One warm connection per function instance at most; DB_POOL_SIZE=0 opts out of pooling entirely.
+        if DB_POOL_SIZE == 0:
+            return {"poolclass": NullPool}
+        return {
+            "pool_size": 1,
+            "max_overflow": 0,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+class PoolMetrics:
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+
+    def attach(self, sync_engine):
+        event.listen(sync_engine, "connect", self.on_connect)
+        event.listen(sync_engine, "checkout", self.on_checkout)
+        event.listen(sync_engine, "checkin", self.on_checkin)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.checkins += 1
+
+    def record_checkout_wait(self, seconds: float, pool):
+        self.checkout_wait_seconds_total += seconds
+        self.checkout_wait_seconds_max = max(self.checkout_wait_seconds_max, seconds)
+        if seconds >= DB_POOL_SLOW_CHECKOUT_SECONDS:
+            logger.warning("Waited %.3fs for a database connection (%s)", seconds, pool.status())
+
+    def snapshot(self, pool) -> dict:
+        return {
+            "profile": self.profile,
+            "pool": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "checked_out": self.checkouts - self.checkins,
+            "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkout_wait_seconds_total": self.checkout_wait_seconds_total,
+            "checkout_wait_seconds_max": self.checkout_wait_seconds_max,
+        }
+
+
+pool_metrics = PoolMetrics(DB_POOL_PROFILE)
+
+
+PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)\s*,?)+\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Collapses whitespace and expanded IN (?, ?, ...) lists so one query pattern maps to one shape."""
+    return PLACEHOLDER_LIST.sub("(?)", " ".join(statement.split()))
+
+
+def redact_parameters(parameters, executemany: bool = False):
+    """Keeps the shape of bound parameters (types, keys, row count) and drops their values."""
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class QueryStats:
+    """Statements run within one `track_queries` block; counts also roll up into enclosing blocks."""
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, shape: str, seconds: float):
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            stats.shapes[shape] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int = DB_REPEATED_QUERY_THRESHOLD) -> dict:
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    stats = QueryStats(parent=current_query_stats.get())
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+def attach_query_instrumentation(sync_engine):
+    """Times every statement into the current request's "sql" phase and QueryStats, logging slow ones."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        record_phase("sql", seconds)
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.record(statement_shape(statement), seconds)
+        if seconds >= DB_SLOW_QUERY_SECONDS:
+            logger.warning("Slow query took %.1f ms: %s parameters=%s", seconds * 1000,
+                           statement_shape(statement), redact_parameters(parameters, executemany))
+
+
+class QueryTrackingMiddleware:
+    """Counts the statements each request runs, logging the total and any likely N+1 pattern."""
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    def __init__(self, app, repeated_query_threshold: int = DB_REPEATED_QUERY_THRESHOLD):
+        self.app = app
+        self.repeated_query_threshold = repeated_query_threshold
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+        logger.debug("%s %s ran %d queries in %.1f ms", scope["method"], scope["path"], stats.count,
+                     stats.seconds * 1000)
+        for shape, count in stats.repeated(self.repeated_query_threshold).items():
+            logger.warning("%s %s ran the same query %d times, likely N+1: %s", scope["method"], scope["path"],
+                           count, shape)
+
+
+SessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
+
+engine = None
+
+
+def get_engine():
+    """Create the engine on first use so importing the app loads no DBAPI driver and opens no connection."""
+    global engine
+    if engine is None:
+        engine = create_async_engine(
+            get_async_database_url(SQLALCHEMY_DATABASE_URL), **get_pool_options(DB_POOL_PROFILE)
+        )
+        pool_metrics.attach(engine.sync_engine)
+        attach_query_instrumentation(engine.sync_engine)
+        SessionLocal.configure(bind=engine)
+    return engine
+
+
+class StickyStore(ABC):
+    """Wall-clock times until which each caller reads from the primary. Kept per process, a caller whose next
+    request lands on another instance can read from a replica that has not caught up yet."""
+
+    @abstractmethod
+    async def get(self, key: str) -> float:
+        """Returns the time until which `key` reads from the primary, or 0."""
+
+    @abstractmethod
+    async def set(self, key: str, until: float):
+        ...
+
+
+class InMemoryStickyStore(StickyStore):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.sticky_until: OrderedDict[str, float] = OrderedDict()
+
+    async def get(self, key: str) -> float:
+        return self.sticky_until.get(key, 0.0)
+
+    async def set(self, key: str, until: float):
+        self.sticky_until[key] = until
+        self.sticky_until.move_to_end(key)
+        while len(self.sticky_until) > self.max_keys:
+            self.sticky_until.popitem(last=False)
+
+
+class ReplicaRouter:
+    """Picks the engine for read-only requests: replicas in turn, except for callers that wrote within
+    `sticky_seconds` and while every replica is cooling down after a failed connection."""
+
+    def __init__(self, replica_urls: list[str], sticky_seconds: float, retry_seconds: float, store: StickyStore):
+        self.replica_urls = replica_urls
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.store = store
+        self.engines = None
+        self.unhealthy_until = [0.0] * len(replica_urls)
+        self.next_index = 0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.sticky_reads = 0
+        self.fallbacks = 0
+
+    def get_engines(self) -> list:
+        if self.engines is None:
+            self.engines = [
+                create_async_engine(get_async_database_url(url), **get_pool_options(DB_POOL_PROFILE))
+                for url in self.replica_urls
+            ]
+            for replica in self.engines:
+                attach_query_instrumentation(replica.sync_engine)
+        return self.engines
+
+    async def choose(self, key: Optional[str]):
+        """Returns (index, engine) of the replica to read from, or None for the primary."""
+        if not self.replica_urls:
+            self.primary_reads += 1
+            return None
+        if key is not None and await self.store.get(key) > time.time():
+            self.sticky_reads += 1
+            self.primary_reads += 1
+            return None
+        for _ in range(len(self.replica_urls)):
+            index = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.replica_urls)
+            if self.unhealthy_until[index] <= time.monotonic():
+                self.replica_reads += 1
+                return index, self.get_engines()[index]
+        self.primary_reads += 1
+        return None
+
+    async def mark_written(self, key: Optional[str]):
+        if key is None or not self.replica_urls:
+            return
+        await self.store.set(key, time.time() + self.sticky_seconds)
+
+    def mark_unhealthy(self, index: int):
+        logger.warning("Replica %d unavailable, reading from the primary for %.0f s", index, self.retry_seconds)
+        self.unhealthy_until[index] = time.monotonic() + self.retry_seconds
+        self.replica_reads -= 1
+        self.primary_reads += 1
+        self.fallbacks += 1
+
+    async def dispose(self):
+        for replica in self.engines or []:
+            await replica.dispose()
+        self.engines = None
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.replica_urls),
+            "healthy": sum(until <= now for until in self.unhealthy_until),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS, REPLICA_STICKY_SECONDS, REPLICA_RETRY_SECONDS,
+                               InMemoryStickyStore(REPLICA_MAX_STICKY_KEYS))
+
+
+async def dispose_engine():
+    if engine is not None:
+        await engine.dispose()
+    await replica_router.dispose()
+
+
+def sticky_key(request: Request) -> Optional[str]:
+    """The caller is the user_id claim of the bearer token, so a refreshed token keeps reading its own writes.
+
+    The claims are read without verifying the signature: this only picks a database for a read, the handler's
+    own auth dependency still rejects a bad token, and a forged one can at most send reads to the primary.
+    Writes mark a caller sticky only from `verified_sticky_key`.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return None
+    user_id = claims.get("user_id") if isinstance(claims, dict) else None
+    return f"user:{user_id}" if isinstance(user_id, int) else None
+
+
+def verified_sticky_key(request: Request) -> Optional[str]:
+    """The caller as verified by `get_current_user`, or None when the handler did not authenticate one."""
+    user_id = getattr(request.state, "user_id", None)
+    return f"user:{user_id}" if user_id is not None else None
+
+
+async def open_session(bind=None):
+    pool = (bind or get_engine()).pool
+    db = SessionLocal(bind=bind) if bind is not None else SessionLocal()
+    started = time.perf_counter()
+    try:
+        await db.connection()
+    except BaseException:
+        await db.close()
+        raise
+    wait_seconds = time.perf_counter() - started
+    if bind is None:
+        pool_metrics.record_checkout_wait(wait_seconds, pool)
+    record_phase("db_wait", wait_seconds)
+    return db
+
+
+async def get_db(request: Request):
+    db = await open_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+    if request.method not in ("GET", "HEAD"):
+        await replica_router.mark_written(verified_sticky_key(request))
+
+
+async def get_read_db(request: Request):
+    """Session for read-only handlers: a replica when configured and healthy, otherwise the primary."""
+    choice = await replica_router.choose(sticky_key(request))
+    db = None
+    if choice is not None:
+        index, replica = choice
+        try:
+            db = await open_session(replica)
+        except (DBAPIError, OSError):
+            replica_router.mark_unhealthy(index)
+    if db is None:
+        db = await open_session()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette import status
+
+from database import SERVERLESS
+from timing import record_phase
+
+logger = logging.getLogger(__name__)
+
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+HASH_POOL_MAX_QUEUE = int(os.getenv("HASH_POOL_MAX_QUEUE", "8"))
+HASH_POOL_RETRY_AFTER = int(os.getenv("HASH_POOL_RETRY_AFTER", "1"))
+# Bulk imports hash in their own pool so a large upload cannot starve logins. Serverless runtimes such as
+# Lambda have no /dev/shm for the semaphores a process pool needs, so they default to threads.
+BULK_HASH_POOL_KIND = os.getenv("BULK_HASH_POOL_KIND", "thread" if SERVERLESS else "process")
+BULK_HASH_POOL_WORKERS = int(os.getenv("BULK_HASH_POOL_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_BCRYPT_ROUNDS = 12
+# A fixed work factor; when unset and BCRYPT_TARGET_MS is set, the factor is calibrated at startup instead.
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "0"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "15"))
+
+
+@cache
+def get_bcrypt_context(rounds: int = DEFAULT_BCRYPT_ROUNDS):
+    # passlib and its bcrypt backend are only imported once a password is actually hashed or checked.
+    from passlib.context import CryptContext
+    # Only a floor: needs_update flags cheaper hashes for an upgrade but never downgrades a costlier one, so
+    # instances that calibrated to different costs do not keep rehashing each other's hashes.
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds)
+
+
+def hash_password(password: str, rounds: int = DEFAULT_BCRYPT_ROUNDS) -> str:
+    return get_bcrypt_context(rounds).hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    # The cost is read from the stored hash, so any policy verifies any bcrypt hash.
+    return get_bcrypt_context().verify(password, hashed_password)
+
+
+def hash_passwords(passwords: list[str], rounds: int) -> list[str]:
+    return [hash_password(password, rounds) for password in passwords]
+
+
+def password_needs_update(hashed_password: str, rounds: int) -> bool:
+    return get_bcrypt_context(rounds).needs_update(hashed_password)
+
+
+def calibrate_rounds(target_seconds: float, min_rounds: int, max_rounds: int) -> int:
+    """Returns the highest cost whose hash time stays within `target_seconds`, never below `min_rounds`.
+
+    Each extra round doubles the work, so one timed hash at `min_rounds` predicts the rest.
+    """
+    started = time.perf_counter()
+    hash_password("calibration", min_rounds)
+    seconds = time.perf_counter() - started
+    rounds = min_rounds
+    while rounds < max_rounds and seconds * 2 <= target_seconds:
+        rounds += 1
+        seconds *= 2
+    return rounds
+
+
+class HashingPolicy:
+    """The bcrypt cost new hashes are made with, and where it came from."""
+
+    def __init__(self, rounds: int, source: str):
+        self.rounds = rounds
+        self.source = source
+        self.configured = False
+
+    def configure(self):
+        # Calibration costs a bcrypt hash, so it runs once per process however often startup is entered.
+        if self.configured:
+            return
+        self.configured = True
+        if BCRYPT_ROUNDS:
+            self.rounds, self.source = int(BCRYPT_ROUNDS), "configured"
+        elif BCRYPT_TARGET_MS:
+            self.rounds = calibrate_rounds(BCRYPT_TARGET_MS / 1000, BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS)
+            self.source = "calibrated"
+        logger.info("bcrypt cost %d (%s)", self.rounds, self.source)
+
+    def metrics(self) -> dict:
+        return {"rounds": self.rounds, "source": self.source}
+
+
+def timed_call(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class HashPool:
+    """Runs bcrypt work off the event loop, rejecting with 503 once `workers + max_queue` calls are in flight."""
+
+    def __init__(self, kind: str, workers: int, max_queue: int, retry_after: int):
+        if kind == "process":
+            # Imported here so multiprocessing stays off the import path of thread-only deployments.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Forking a process that already runs hash and database threads can copy a held lock into the
+            # child; workers start from a clean forkserver process instead.
+            self.executor = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context("forkserver"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.kind = kind
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+        self.run_seconds_max = 0.0
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again later",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            result, run_seconds = await asyncio.get_running_loop().run_in_executor(
+                self.executor, timed_call, fn, *args
+            )
+        finally:
+            self.in_flight -= 1
+        wait_seconds = max(time.perf_counter() - submitted - run_seconds, 0.0)
+        record_phase("hash_wait", wait_seconds)
+        record_phase("hash", run_seconds)
+
+        self.completed += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+        self.run_seconds_total += run_seconds
+        self.run_seconds_max = max(self.run_seconds_max, run_seconds)
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "run_seconds_total": self.run_seconds_total,
+            "run_seconds_max": self.run_seconds_max,
+        }
+
+
+hashing_policy = HashingPolicy(int(BCRYPT_ROUNDS or DEFAULT_BCRYPT_ROUNDS), "configured" if BCRYPT_ROUNDS else "default")
+
+hash_pool = HashPool(HASH_POOL_KIND, HASH_POOL_WORKERS, HASH_POOL_MAX_QUEUE, HASH_POOL_RETRY_AFTER)
+
+
+
+@cache
+def get_bulk_hash_pool() -> HashPool:
+    # Built on the first import request, so importing the app never starts worker processes.
+    return HashPool(BULK_HASH_POOL_KIND, BULK_HASH_POOL_WORKERS, 4 * BULK_HASH_POOL_WORKERS, HASH_POOL_RETRY_AFTER)
+
+
+async def hash_passwords_parallel(passwords: list[str], rounds: int, pool: Optional[HashPool] = None) -> list[str]:
+    """Hashes `passwords` in one chunk per worker, so each executor task amortizes its pickling round trip."""
+    if not passwords:
+        return []
+    pool = pool or get_bulk_hash_pool()
+    size = -(-len(passwords) // pool.workers)
+    chunks = await asyncio.gather(*(
+        pool.run(hash_passwords, passwords[start:start + size], rounds) for start in range(0, len(passwords), size)
+    ))
+    return [hashed_password for chunk in chunks for hashed_password in chunk]
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 
 
 class User(Base):
@@ -14,6 +14,10 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     role = Column(String, default="user")
     phone_number = Column(String)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    todos_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Tombstones at or below this version have been compacted away; older change-feed cursors must resync.
+    changes_floor = Column(Integer, nullable=False, default=0, server_default="0")
 
 
 class Todos(Base):
@@ -22,6 +26,51 @@ class Todos(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     description = Column(String)
-    priority = Column(Integer)
+    # NOT NULL keeps sort=priority keyset cursors comparable; a NULL cannot be compared or encoded in a cursor.
+    priority = Column(Integer, nullable=False)
     completed = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # The owner's users.todos_version as of this row's last write.
+    changed_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_todos_owner_id_id", "owner_id", "id"),
+        Index("ix_todos_owner_id_completed_priority", "owner_id", "completed", "priority"),
+        # sort=priority without a completed filter spans both completed values, which the index above can't order.
+        Index("ix_todos_owner_id_priority_id", "owner_id", "priority", "id"),
+        Index("ix_todos_owner_id_changed_version", "owner_id", "changed_version"),
+    )
+
+
+class TodoStats(Base):
+    __tablename__ = "todo_stats"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    priority = Column(Integer, primary_key=True)
+    completed = Column(Boolean, primary_key=True)
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, nullable=False, unique=True, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked = Column(Boolean, nullable=False, default=False, server_default="0")
+
+
+class TodoTombstone(Base):
+    __tablename__ = "todo_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    todo_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_todo_tombstones_owner_id_version", "owner_id", "version"),
+    )
@@ -0,0 +1,65 @@
+import base64
+import binascii
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from starlette import status
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def cursor_values(cursor: str, names) -> dict:
+    values = decode_cursor(cursor)
+    if set(values) != set(names) or not all(isinstance(values[name], int) for name in names):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def keyset_after(columns: dict, values: dict, descending: bool = False):
+    # (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y), which every backend can turn into an index range.
+    names = list(columns)
+    condition = None
+    for name in reversed(names):
+        column = columns[name]
+        beyond = column < values[name] if descending else column > values[name]
+        condition = beyond if condition is None else or_(beyond, and_(column == values[name], condition))
+    return condition
+
+
+async def paginate_by_keys(db, statement, columns: dict, cursor: Optional[str], limit: int,
+                           descending: bool = False):
+    """Keyset pagination ordered by `columns` (cursor key -> integer column), all in the same direction."""
+    if cursor is not None:
+        statement = statement.where(keyset_after(columns, cursor_values(cursor, columns), descending))
+    order_by = [column.desc() if descending else column for column in columns.values()]
+    result = await db.execute(statement.order_by(*order_by).limit(limit + 1))
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor({name: getattr(rows[limit - 1], name) for name in columns})
+    return {
+        "data": rows[:limit],
+        "next_cursor": next_cursor
+    }
+
+
+async def paginate_by_id(db, statement, id_column, cursor: Optional[str], limit: int):
+    return await paginate_by_keys(db, statement, {"id": id_column}, cursor, limit)
@@ -1,12 +1,26 @@
-from typing import Annotated
+import csv
+import io
+import json
+import tempfile
+from typing import Annotated, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from database import SessionLocal
+from admission import auth_admission
+from cache import todo_list_cache
+from database import get_db, get_engine, get_read_db, pool_metrics, replica_router
+from hashing import hash_pool, hashing_policy
 from models import Todos
-from .auth import get_current_user
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate_by_id
+from stats import apply_todo_stats, get_todo_stats, reconcile_todo_stats
+from user_import import import_users
+from .auth import get_current_user, purge_refresh_tokens
+from changes import compact_tombstones, record_tombstones
+from .todos import TodoPage, bump_todos_version
 
 router = APIRouter(
     prefix="/admin",
@@ -14,33 +28,153 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+user_dependency = Annotated[dict, Depends(get_current_user)]
 
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+# The per-row import report spills to a temporary file beyond this size.
+IMPORT_REPORT_MEMORY_BYTES = 1024 * 1024
 
-db_dependency = Annotated[Session, Depends(get_db)]
-user_dependency = Annotated[dict, Depends(get_current_user)]
+@router.get("/todos", response_model=TodoPage, status_code=status.HTTP_200_OK)
+async def get_todos(db: read_db_dependency, user: user_dependency,
+                    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None):
+    check_user_validation(user)
+    return await paginate_by_id(db, select(Todos), Todos.id, cursor, limit)
 
-@router.get("/todos", status_code=status.HTTP_200_OK)
-async def get_todos(db: db_dependency, user: user_dependency):
+@router.get("/todos/export", status_code=status.HTTP_200_OK)
+async def export_todos(db: read_db_dependency, user: user_dependency,
+                       export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format")):
     check_user_validation(user)
-    todos = db.query(Todos).all()
-    return todos
+    return StreamingResponse(
+        stream_todos(db, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=todos.{export_format}"}
+    )
 
 @router.delete("/todos/{todo_id}/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo(db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)):
     check_user_validation(user)
-    todo = db.query(Todos).filter(Todos.id == todo_id).first()
-
+    # Lock the owner's users row before the todo, in the same order as the owner's own writes.
+    result = await db.execute(select(Todos.owner_id).where(Todos.id == todo_id))
+    todo = result.first()
     if todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
+    owner_id = todo.owner_id
+    if owner_id is not None:
+        todos_version = await bump_todos_version(db, owner_id)
+    result = await db.execute(
+        delete(Todos)
+        .where(Todos.id == todo_id)
+        .where(Todos.owner_id == owner_id)
+        .returning(Todos.priority, Todos.completed)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.first()
+
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+
+    # An ownerless todo has no counters, change feed or cached pages to update.
+    if owner_id is not None:
+        await apply_todo_stats(db, owner_id, removed=[tuple(deleted)])
+        await record_tombstones(db, owner_id, [todo_id], todos_version)
+    await db.commit()
+    if owner_id is not None:
+        await todo_list_cache.invalidate(owner_id)
+
+@router.post("/users/import", status_code=status.HTTP_200_OK)
+async def import_users_file(request: Request, db: db_dependency, user: user_dependency,
+                            import_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format")):
+    check_user_validation(user)
+    report = tempfile.SpooledTemporaryFile(max_size=IMPORT_REPORT_MEMORY_BYTES)
+    try:
+        await import_users(db, request.stream(), import_format, report)
+    except BaseException:
+        report.close()
+        raise
+    report.seek(0)
+    return StreamingResponse(read_report(report), media_type=EXPORT_MEDIA_TYPES["ndjson"])
+
+@router.get("/stats", status_code=status.HTTP_200_OK)
+async def get_stats(db: read_db_dependency, user: user_dependency, owner_id: Optional[int] = Query(default=None, gt=0)):
+    check_user_validation(user)
+    return await get_todo_stats(db, owner_id)
+
+@router.post("/stats/reconcile", status_code=status.HTTP_200_OK)
+async def reconcile_stats(db: db_dependency, user: user_dependency):
+    check_user_validation(user)
+    drift = await reconcile_todo_stats(db)
+    return {"drifted": len(drift), "drift": drift}
+
+@router.post("/changes/compact", status_code=status.HTTP_200_OK)
+async def compact_changes(db: db_dependency, user: user_dependency):
+    check_user_validation(user)
+    return {"compacted": await compact_tombstones(db)}
+
+@router.post("/refresh-tokens/purge", status_code=status.HTTP_200_OK)
+async def purge_expired_refresh_tokens(db: db_dependency, user: user_dependency):
+    check_user_validation(user)
+    return {"purged": await purge_refresh_tokens(db)}
+
+@router.get("/metrics/hash-pool", status_code=status.HTTP_200_OK)
+async def get_hash_pool_metrics(user: user_dependency):
+    check_user_validation(user)
+    return {**hash_pool.metrics(), "bcrypt": hashing_policy.metrics()}
+
+@router.get("/metrics/auth-admission", status_code=status.HTTP_200_OK)
+async def get_auth_admission_metrics(user: user_dependency):
+    check_user_validation(user)
+    return auth_admission.metrics()
+
+@router.get("/metrics/todo-cache", status_code=status.HTTP_200_OK)
+async def get_todo_cache_metrics(user: user_dependency):
+    check_user_validation(user)
+    return todo_list_cache.metrics()
+
+@router.get("/metrics/db-pool", status_code=status.HTTP_200_OK)
+async def get_db_pool_metrics(user: user_dependency):
+    check_user_validation(user)
+    return pool_metrics.snapshot(get_engine().pool)
+
+@router.get("/metrics/db-replicas", status_code=status.HTTP_200_OK)
+async def get_db_replica_metrics(user: user_dependency):
+    check_user_validation(user)
+    return replica_router.metrics()
+
+async def stream_todos(db: AsyncSession, export_format: str):
+    # The get_db dependency has already closed this session by the time the body is
+    # sent, so the stream checks out its own connection and releases it when done.
+    columns = Todos.__table__.columns
+    if export_format == "csv":
+        yield format_csv([[column.name for column in columns]])
+    try:
+        result = await db.stream(
+            select(*columns).order_by(Todos.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        async for rows in result.partitions():
+            if export_format == "csv":
+                yield format_csv(rows)
+            else:
+                yield "".join(json.dumps(dict(row._mapping)) + "\n" for row in rows)
+    finally:
+        await db.close()
+
+def read_report(report):
+    try:
+        yield from iter(lambda: report.read(64 * 1024), b"")
+    finally:
+        report.close()
 
-    db.delete(todo)
-    db.commit()
+def format_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
 
 def check_user_validation(user: user_dependency):
     if user is None or user.get('role') != 'admin':
@@ -1,28 +1,34 @@
+import hashlib
+import os
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from jose import jwt, JWTError
-from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from database import SessionLocal
-from models import User
+from admission import auth_admission, client_ip
+from cache import verified_token_cache
+from database import get_db
+from hashing import hash_pool, hash_password, hashing_policy, password_needs_update, verify_password
+from models import RefreshToken, User
+from timing import timed_phase
 
 router = APIRouter(
     prefix="/auth",
     tags=["auth"]
 )
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 SECRET_KEY = "secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 
 class CreateUserRequest(BaseModel):
@@ -39,28 +45,43 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     expires_in: int
+    refresh_token: str
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 
-def authenticate_user(email: str, password: str, db):
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(email: str, password: str, db):
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    if not await hash_pool.run(verify_password, password, user.hashed_password):
         return False
+    if password_needs_update(user.hashed_password, hashing_policy.rounds):
+        await rehash_password(db, user, password)
     return user
 
 
+async def rehash_password(db, user: User, password: str):
+    # Best effort: a busy hash pool only postpones the upgrade to a later login. The caller commits.
+    try:
+        new_hashed_password = await hash_pool.run(hash_password, password, hashing_policy.rounds)
+    except HTTPException:
+        return
+    await db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .where(User.hashed_password == user.hashed_password)
+        .values(hashed_password=new_hashed_password)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def create_access_token(email: str, user_id: int, role: str, expires_delta: timedelta):
     payload = {
         "email": email,
@@ -68,10 +89,25 @@ def create_access_token(email: str, user_id: int, role: str, expires_delta: time
         "role": role,
         "exp": datetime.now(timezone.utc) + expires_delta
     }
+    from jose import jwt
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], request: Request = None):
+    with timed_phase("auth"):
+        principal = decode_principal(token)
+    if request is not None:
+        # Read by get_db, which keeps a caller who wrote on the primary only once their token has been verified.
+        request.state.user_id = principal["user_id"]
+    return principal
+
+
+def decode_principal(token: str) -> dict:
+    principal = verified_token_cache.get(token)
+    if principal is not None:
+        return principal
+    # jose pulls in the cryptography backends, so it is imported on the first uncached token only.
+    from jose import jwt, JWTError
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("email")
@@ -79,44 +115,144 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
         role = payload.get("role")
         if email is None or user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-        return {
+        principal = {
             "email": email,
             "user_id": user_id,
             "role": role
         }
+        if payload.get("exp") is not None:
+            verified_token_cache.set(token, principal, payload["exp"])
+        return principal
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def create_user(db: db_dependency, create_user_request: CreateUserRequest):
-    if db.query(User).filter(User.email == create_user_request.email).first():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
-    create_user_model = User(
-        email=create_user_request.email,
-        username=create_user_request.username,
-        first_name=create_user_request.first_name,
-        last_name=create_user_request.last_name,
-        phone_number=create_user_request.phone_number,
-        hashed_password=bcrypt_context.hash(create_user_request.password),
-        role=create_user_request.role,
-        is_active=True
-    )
+async def create_user(request: Request, db: db_dependency, create_user_request: CreateUserRequest):
+    async with auth_admission.admit(client_ip(request), create_user_request.email):
+        result = await db.execute(select(User).where(User.email == create_user_request.email))
+        if result.scalars().first():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
+        hashed_password = await hash_pool.run(hash_password, create_user_request.password, hashing_policy.rounds)
+        create_user_model = User(
+            email=create_user_request.email,
+            username=create_user_request.username,
+            first_name=create_user_request.first_name,
+            last_name=create_user_request.last_name,
+            phone_number=create_user_request.phone_number,
+            hashed_password=hashed_password,
+            role=create_user_request.role,
+            is_active=True
+        )
 
-    db.add(create_user_model)
-    db.commit()
+        db.add(create_user_model)
+        await db.commit()
 
-    return {"message": "user successfully created"}
+        return {"message": "user successfully created"}
 
 
 @router.post("/login", response_model=Token, status_code=status.HTTP_200_OK)
-async def login(db: db_dependency, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = authenticate_user(form_data.username, form_data.password, db)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    token = create_access_token(user.email, user.id, user.role, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+async def login(request: Request, db: db_dependency, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    async with auth_admission.admit(client_ip(request), form_data.username):
+        user = await authenticate_user(form_data.username, form_data.password, db)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+        refresh_token = await issue_refresh_token(db, user.id)
+        await db.commit()
+        return token_response(user.email, user.id, user.role, refresh_token)
+
+
+@router.post("/refresh", response_model=Token, status_code=status.HTTP_200_OK)
+async def refresh(db: db_dependency, request: RefreshTokenRequest):
+    # Rotation: the presented token is spent atomically, so two concurrent refreshes cannot both succeed.
+    result = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == hash_refresh_token(request.refresh_token))
+        .where(RefreshToken.revoked.is_(False))
+        .where(RefreshToken.expires_at > datetime.now(timezone.utc))
+        .values(revoked=True)
+        .returning(RefreshToken.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    user_id = result.scalar()
+    if user_id is None:
+        await revoke_reused_refresh_token(db, request.refresh_token)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    result = await db.execute(select(User.email, User.role, User.is_active).where(User.id == user_id))
+    user = result.first()
+    if user is None or not user.is_active:
+        await db.commit()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    refresh_token = await issue_refresh_token(db, user_id)
+    await db.commit()
+    return token_response(user.email, user_id, user.role, refresh_token)
+
+
+@router.post("/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke(db: db_dependency, request: RefreshTokenRequest):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == hash_refresh_token(request.refresh_token))
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough; only the digest is stored.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_refresh_token(db, user_id: int) -> str:
+    token = secrets.token_urlsafe(32)
+    await db.execute(insert(RefreshToken).values(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+
+async def revoke_reused_refresh_token(db, token: str):
+    # A spent token being presented again means it leaked; revoke every refresh token of its user.
+    result = await db.execute(
+        select(RefreshToken.user_id)
+        .where(RefreshToken.token_hash == hash_refresh_token(token))
+        .where(RefreshToken.revoked.is_(True))
+    )
+    user_id = result.scalar()
+    if user_id is not None:
+        await revoke_refresh_tokens(db, user_id)
+        await db.commit()
+
+
+async def revoke_refresh_tokens(db, user_id: int):
+    """Revokes every refresh token of the user; runs inside the caller's transaction."""
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id)
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def purge_refresh_tokens(db) -> int:
+    """Deletes expired refresh tokens. Spent ones are kept until they expire, so reuse is still detected."""
+    result = await db.execute(
+        delete(RefreshToken)
+        .where(RefreshToken.expires_at <= datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+def token_response(email: str, user_id: int, role: str, refresh_token: str) -> dict:
     return {
-        "access_token": token,
+        "access_token": create_access_token(email, user_id, role, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)),
         "token_type": "bearer",
-        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token
     }
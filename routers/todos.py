@@ -1,12 +1,20 @@
-from typing import Annotated
+from typing import Annotated, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Response
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from database import SessionLocal
-from models import Todos
+from cache import todo_list_cache
+from changes import get_changes, record_tombstones
+from database import get_db, get_read_db
+from etag import etag_matches, make_etag, not_modified
+from models import Todos, User
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate_by_id, paginate_by_keys
+from search import search_todos
+from stats import apply_todo_stats, get_todo_stats
+from timing import timed_phase
 from .auth import get_current_user
 
 router = APIRouter(
@@ -15,17 +23,12 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+MAX_BULK_ITEMS = 100
+
 
 class TodoRequest(BaseModel):
     title: str = Field(min_length=3, max_length=50)
@@ -34,57 +37,370 @@ class TodoRequest(BaseModel):
     completed: bool
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def get_todos(db: db_dependency, user: user_dependency):
+class TodoPatchRequest(BaseModel):
+    title: Optional[str] = Field(default=None, min_length=3, max_length=50)
+    description: Optional[str] = Field(default=None, min_length=3, max_length=255)
+    priority: Optional[int] = Field(default=None, gt=0, lt=6)
+    completed: Optional[bool] = None
+
+
+class TodoResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: Optional[str]
+    description: Optional[str]
+    priority: int
+    completed: Optional[bool]
+    owner_id: Optional[int]
+    version: int
+
+
+class TodoPage(BaseModel):
+    data: list[TodoResponse]
+    next_cursor: Optional[str]
+
+
+class TodoResult(BaseModel):
+    message: str
+    data: TodoResponse
+
+
+class TodoListResult(BaseModel):
+    message: str
+    data: list[TodoResponse]
+
+
+class TodoChanges(BaseModel):
+    version: int
+    changed: list[TodoResponse]
+    deleted: list[int]
+    next_cursor: Optional[str]
+
+
+class TodoBulkUpdateItem(TodoRequest):
+    id: int = Field(gt=0)
+
+
+class TodoBulkCreateRequest(BaseModel):
+    items: list[TodoRequest] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class TodoBulkUpdateRequest(BaseModel):
+    items: list[TodoBulkUpdateItem] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class TodoBulkDeleteRequest(BaseModel):
+    ids: list[Annotated[int, Field(gt=0)]] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+@router.get("/", response_model=TodoPage, status_code=status.HTTP_200_OK)
+async def get_todos(db: read_db_dependency, user: user_dependency,
+                    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None,
+                    completed: Optional[bool] = None,
+                    min_priority: Optional[int] = Query(default=None, gt=0, lt=6),
+                    max_priority: Optional[int] = Query(default=None, gt=0, lt=6),
+                    sort: Literal["id", "priority"] = "id",
+                    if_none_match: Optional[str] = Header(default=None)):
     get_user_validation(user)
-    return db.query(Todos).filter(Todos.owner_id == user.get('user_id')).all()
+    todos_version = await get_todos_version(db, user.get('user_id'))
+    etag = make_etag("todos", user.get('user_id'), todos_version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
 
+    page_key = f"{todos_version}:{completed}:{min_priority}:{max_priority}:{sort}:{cursor}:{limit}"
+    body = await todo_list_cache.get(user.get('user_id'), page_key)
+    if body is None:
+        statement = filter_todos(user.get('user_id'), completed, min_priority, max_priority)
+        if sort == "priority":
+            page = await paginate_by_keys(
+                db, statement, {"priority": Todos.priority, "id": Todos.id}, cursor, limit, descending=True
+            )
+        else:
+            page = await paginate_by_id(db, statement, Todos.id, cursor, limit)
+        with timed_phase("serialize"):
+            body = TodoPage.model_validate(page, from_attributes=True).model_dump_json().encode()
+        await todo_list_cache.set(user.get('user_id'), page_key, body)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
-@router.get("/{todo_id}", status_code=status.HTTP_200_OK)
-async def get_todo(db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)):
+
+@router.get("/top", response_model=list[TodoResponse], status_code=status.HTTP_200_OK)
+async def get_top_todos(db: read_db_dependency, user: user_dependency,
+                        k: int = Query(default=10, gt=0, le=MAX_PAGE_SIZE)):
     get_user_validation(user)
-    todo = db.query(Todos).filter(Todos.id == todo_id).where(Todos.owner_id == user.get('user_id')).first()
+    # Walks ix_todos_owner_id_completed_priority backwards and stops after k rows.
+    result = await db.execute(
+        filter_todos(user.get('user_id'), False, None, None)
+        .order_by(Todos.priority.desc(), Todos.id.desc())
+        .limit(k)
+    )
+    return result.scalars().all()
+
+
+@router.get("/search", response_model=TodoPage, status_code=status.HTTP_200_OK)
+async def search(db: read_db_dependency, user: user_dependency,
+                 q: str = Query(min_length=1, max_length=255),
+                 limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None):
+    get_user_validation(user)
+    return await search_todos(db, user.get('user_id'), q, cursor, limit)
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK)
+async def get_stats(db: read_db_dependency, user: user_dependency):
+    get_user_validation(user)
+    return await get_todo_stats(db, user.get('user_id'))
+
+
+@router.get("/changes", response_model=TodoChanges, status_code=status.HTTP_200_OK)
+async def get_changes_since(db: read_db_dependency, user: user_dependency, since: Optional[int] = Query(default=None, ge=0),
+                            limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None):
+    get_user_validation(user)
+    return await get_changes(db, user.get('user_id'), since, cursor, limit)
+
+
+@router.get("/{todo_id}", response_model=TodoResponse, status_code=status.HTTP_200_OK)
+async def get_todo(db: read_db_dependency, user: user_dependency, response: Response, todo_id: int = Path(gt=0),
+                   if_none_match: Optional[str] = Header(default=None)):
+    get_user_validation(user)
+    if if_none_match is not None:
+        result = await db.execute(
+            select(Todos.changed_version, Todos.version)
+            .where(Todos.id == todo_id)
+            .where(Todos.owner_id == user.get('user_id'))
+        )
+        versions = result.first()
+        if versions is not None and etag_matches(if_none_match, make_etag("todo", todo_id, *versions)):
+            return not_modified(make_etag("todo", todo_id, *versions))
+    result = await db.execute(select(Todos).where(Todos.id == todo_id).where(Todos.owner_id == user.get('user_id')))
+    todo = result.scalars().first()
     if not todo:
         raise HTTPException(status_code=404, detail="Data not found")
+    response.headers["ETag"] = todo_etag(todo)
     return todo
 
 
-@router.post("/add", status_code=status.HTTP_201_CREATED)
+@router.post("/add", response_model=TodoResult, status_code=status.HTTP_201_CREATED)
 async def add_todo(request: TodoRequest, db: db_dependency, user: user_dependency):
     get_user_validation(user)
-    new_todo = Todos(**request.model_dump(), owner_id=user.get('user_id'))
+    todos_version = await bump_todos_version(db, user.get('user_id'))
+    new_todo = Todos(**request.model_dump(), owner_id=user.get('user_id'), changed_version=todos_version)
     db.add(new_todo)
-    db.commit()
-    db.refresh(new_todo)
+    await apply_todo_stats(db, user.get('user_id'), added=[(request.priority, request.completed)])
+    await db.commit()
+    await todo_list_cache.invalidate(user.get('user_id'))
+    await db.refresh(new_todo)
     return {
         "message": "Success add todo",
         "data": new_todo
     }
 
 
+@router.post("/bulk", response_model=TodoListResult, status_code=status.HTTP_201_CREATED)
+async def add_todos(request: TodoBulkCreateRequest, db: db_dependency, user: user_dependency):
+    get_user_validation(user)
+    todos_version = await bump_todos_version(db, user.get('user_id'))
+    result = await db.execute(
+        insert(Todos).returning(Todos, sort_by_parameter_order=True),
+        [
+            {**item.model_dump(), "owner_id": user.get('user_id'), "changed_version": todos_version}
+            for item in request.items
+        ]
+    )
+    new_todos = result.scalars().all()
+    await apply_todo_stats(db, user.get('user_id'), added=[(todo.priority, todo.completed) for todo in new_todos])
+    await db.commit()
+    await todo_list_cache.invalidate(user.get('user_id'))
+    return {
+        "message": "Success add todos",
+        "data": new_todos
+    }
+
+
+@router.patch("/bulk", status_code=status.HTTP_200_OK)
+async def update_todos(request: TodoBulkUpdateRequest, db: db_dependency, user: user_dependency):
+    get_user_validation(user)
+    items = {item.id: item for item in request.items}
+    values = {
+        field: case({todo_id: getattr(item, field) for todo_id, item in items.items()}, value=Todos.id)
+        for field in TodoRequest.model_fields
+    }
+    values["version"] = Todos.version + 1
+    values["changed_version"] = await bump_todos_version(db, user.get('user_id'))
+    previous = await lock_todo_stats_keys(db, user.get('user_id'), items)
+    result = await db.execute(
+        update(Todos)
+        .where(Todos.owner_id == user.get('user_id'))
+        .where(Todos.id.in_(items))
+        .values(**values)
+        .returning(Todos.id)
+        .execution_options(synchronize_session=False)
+    )
+    updated_ids = set(result.scalars().all())
+    if updated_ids:
+        await apply_todo_stats(
+            db, user.get('user_id'),
+            added=[(items[todo_id].priority, items[todo_id].completed) for todo_id in updated_ids],
+            removed=[previous[todo_id] for todo_id in updated_ids]
+        )
+        await db.commit()
+    else:
+        await db.rollback()
+    await todo_list_cache.invalidate(user.get('user_id'))
+    return {
+        "message": "Success update todos",
+        "data": [
+            {"id": item.id, "status": "updated" if item.id in updated_ids else "not_found"}
+            for item in request.items
+        ]
+    }
+
+
+@router.delete("/bulk", status_code=status.HTTP_200_OK)
+async def delete_todos(request: TodoBulkDeleteRequest, db: db_dependency, user: user_dependency):
+    get_user_validation(user)
+    todos_version = await bump_todos_version(db, user.get('user_id'))
+    result = await db.execute(
+        delete(Todos)
+        .where(Todos.owner_id == user.get('user_id'))
+        .where(Todos.id.in_(request.ids))
+        .returning(Todos.id, Todos.priority, Todos.completed)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.all()
+    deleted_ids = {todo_id for todo_id, _, _ in deleted}
+    if deleted_ids:
+        await apply_todo_stats(
+            db, user.get('user_id'), removed=[(priority, completed) for _, priority, completed in deleted]
+        )
+        await record_tombstones(db, user.get('user_id'), deleted_ids, todos_version)
+        await db.commit()
+    else:
+        await db.rollback()
+    await todo_list_cache.invalidate(user.get('user_id'))
+    return {
+        "message": "Success delete todos",
+        "data": [
+            {"id": todo_id, "status": "deleted" if todo_id in deleted_ids else "not_found"}
+            for todo_id in request.ids
+        ]
+    }
+
+
+@router.patch("/{todo_id}", response_model=TodoResult, status_code=status.HTTP_200_OK)
+async def patch_todo(request: TodoPatchRequest, db: db_dependency, user: user_dependency,
+                     todo_id: int = Path(gt=0)):
+    get_user_validation(user)
+    values = request.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    todo = await update_owned_todo(db, user.get('user_id'), todo_id, values)
+    return {
+        "message": "Success update todo",
+        "data": todo
+    }
+
+
 @router.put("/{todo_id}/update", status_code=status.HTTP_204_NO_CONTENT)
 async def update_todo(request: TodoRequest, db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)):
     get_user_validation(user)
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).where(Todos.owner_id == user.get('user_id')).first()
-    if not todo_model:
-        raise HTTPException(status_code=404, detail="Todo not found")
-    todo_model.title = request.title
-    todo_model.description = request.description
-    todo_model.priority = request.priority
-    todo_model.completed = request.completed
-
-    db.add(todo_model)
-    db.commit()
+    await update_owned_todo(db, user.get('user_id'), todo_id, request.model_dump())
 
 
 @router.delete("/{todo_id}/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo(db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)):
     get_user_validation(user)
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).where(Todos.owner_id == user.get('user_id')).first()
-    if todo_model is None:
+    todos_version = await bump_todos_version(db, user.get('user_id'))
+    result = await db.execute(
+        delete(Todos)
+        .where(Todos.id == todo_id)
+        .where(Todos.owner_id == user.get('user_id'))
+        .returning(Todos.priority, Todos.completed)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.first()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Todo not found")
-    db.delete(todo_model)
-    db.commit()
+    await apply_todo_stats(db, user.get('user_id'), removed=[tuple(deleted)])
+    await record_tombstones(db, user.get('user_id'), [todo_id], todos_version)
+    await db.commit()
+    await todo_list_cache.invalidate(user.get('user_id'))
+
+
+async def update_owned_todo(db: AsyncSession, owner_id: int, todo_id: int, values: dict):
+    changed_version = await bump_todos_version(db, owner_id)
+    previous = {}
+    if values.keys() & {"priority", "completed"}:
+        previous = await lock_todo_stats_keys(db, owner_id, [todo_id])
+    result = await db.execute(
+        update(Todos)
+        .where(Todos.id == todo_id)
+        .where(Todos.owner_id == owner_id)
+        .values(**values, version=Todos.version + 1, changed_version=changed_version)
+        .returning(Todos)
+        .execution_options(synchronize_session=False)
+    )
+    todo = result.scalar()
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    if previous:
+        await apply_todo_stats(db, owner_id, added=[(todo.priority, todo.completed)], removed=[previous[todo_id]])
+    await db.commit()
+    await todo_list_cache.invalidate(owner_id)
+    return todo
+
+
+def todo_etag(todo: Todos) -> str:
+    # SQLite can hand a deleted todo's id to the next insert, which starts again at version 1; the owner's
+    # changed_version never repeats, so a recycled id still gets a fresh ETag.
+    return make_etag("todo", todo.id, todo.changed_version, todo.version)
+
+
+def filter_todos(owner_id: int, completed: Optional[bool], min_priority: Optional[int],
+                 max_priority: Optional[int]):
+    if min_priority is not None and max_priority is not None and min_priority > max_priority:
+        raise HTTPException(status_code=400, detail="Invalid priority range")
+    statement = select(Todos).where(Todos.owner_id == owner_id)
+    if completed is not None:
+        statement = statement.where(Todos.completed.is_(completed))
+    if min_priority is not None:
+        statement = statement.where(Todos.priority >= min_priority)
+    if max_priority is not None:
+        statement = statement.where(Todos.priority <= max_priority)
+    return statement
+
+
+async def lock_todo_stats_keys(db: AsyncSession, owner_id: int, todo_ids) -> dict:
+    # The counters need each row's (priority, completed) from before the update; the row lock
+    # keeps a concurrent writer from changing it between this read and the UPDATE.
+    result = await db.execute(
+        select(Todos.id, Todos.priority, Todos.completed)
+        .where(Todos.owner_id == owner_id)
+        .where(Todos.id.in_(todo_ids))
+        .with_for_update()
+    )
+    return {todo_id: (priority, completed) for todo_id, priority, completed in result.all()}
+
+
+async def get_todos_version(db: AsyncSession, owner_id: int) -> int:
+    result = await db.execute(select(User.todos_version).where(User.id == owner_id))
+    return result.scalar() or 0
+
+
+async def bump_todos_version(db: AsyncSession, owner_id: int) -> int:
+    """Bumps and returns the owner's change version. Writes call this first: the users row lock it takes is
+    held until commit, so an owner's changes commit in version order and the change feed never skips one."""
+    result = await db.execute(
+        update(User)
+        .where(User.id == owner_id)
+        .values(todos_version=User.todos_version + 1)
+        .returning(User.todos_version)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar() or 0
+
 
 def get_user_validation(user: user_dependency):
     if user is None:
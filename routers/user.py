@@ -1,14 +1,16 @@
 from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from passlib.context import CryptContext
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from database import SessionLocal
+from database import get_db, get_read_db
+from etag import etag_matches, make_etag, not_modified
+from hashing import hash_pool, hash_password, hashing_policy, verify_password
 from models import User
-from .auth import get_current_user
+from .auth import get_current_user, revoke_refresh_tokens
 
 router = APIRouter(
     prefix="/user",
@@ -16,14 +18,6 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class UserResponse(BaseModel):
     user_id: int
     email: str
@@ -44,15 +38,23 @@ class UserProfileRequest(BaseModel):
     email: str
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_user(db: db_dependency, user: user_dependency):
+async def get_user(db: read_db_dependency, user: user_dependency, response: Response,
+                   if_none_match: Optional[str] = Header(default=None)):
     validate_current_user(user)
-    current_user = db.query(User).filter(User.id == user.get('user_id')).first()
+    if if_none_match is not None:
+        result = await db.execute(select(User.version).where(User.id == user.get('user_id')))
+        version = result.scalar()
+        if version is not None and etag_matches(if_none_match, make_etag("user", user.get('user_id'), version)):
+            return not_modified(make_etag("user", user.get('user_id'), version))
+    result = await db.execute(select(User).where(User.id == user.get('user_id')))
+    current_user = result.scalars().first()
+    response.headers["ETag"] = make_etag("user", current_user.id, current_user.version)
     return UserResponse(
         user_id=current_user.id,
         email=current_user.email,
@@ -66,29 +68,47 @@ async def get_user(db: db_dependency, user: user_dependency):
 @router.put("/change-password", status_code=status.HTTP_204_NO_CONTENT)
 async def change_password(db: db_dependency, user: user_dependency, password: ChangePasswordRequest):
     validate_current_user(user)
-    current_user = db.query(User).filter(User.id == user.get('user_id')).first()
-    validate_current_password(password.current_password, current_user.hashed_password)
-    current_user.hashed_password = bcrypt_context.hash(password.new_password)
-    db.add(current_user)
-    db.commit()
+    result = await db.execute(select(User.hashed_password).where(User.id == user.get('user_id')))
+    current_hashed_password = result.scalar()
+    if current_hashed_password is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    await validate_current_password(password.current_password, current_hashed_password)
+    new_hashed_password = await hash_pool.run(hash_password, password.new_password, hashing_policy.rounds)
+    # Sessions started with the old password end with it; this commits together with the update below.
+    await revoke_refresh_tokens(db, user.get('user_id'))
+    # Matching on the old hash makes a concurrent password change fail instead of being overwritten.
+    await update_current_user(db, user.get('user_id'), {"hashed_password": new_hashed_password},
+                              User.hashed_password == current_hashed_password,
+                              conflict_detail="Password was changed by another request, try again")
 
 def validate_current_user(user: user_dependency):
     if user is None:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-def validate_current_password(current_password: str, hashed_password: str):
-    if not bcrypt_context.verify(current_password, hashed_password):
+async def validate_current_password(current_password: str, hashed_password: str):
+    if not await hash_pool.run(verify_password, current_password, hashed_password):
         raise HTTPException(status_code=400, detail="Confirm password is incorrect")
 
 @router.put("/change-profile", status_code=status.HTTP_204_NO_CONTENT)
 async def change_profile(db: db_dependency, user: user_dependency, profile: UserProfileRequest):
     validate_current_user(user)
-    current_user = db.query(User).filter(User.id == user.get('user_id')).first()
-    current_user.first_name = profile.first_name
-    current_user.last_name = profile.last_name
-    current_user.phone_number = profile.phone_number
-    current_user.email = profile.email
-    db.add(current_user)
-    db.commit()
+    await update_current_user(db, user.get('user_id'), profile.model_dump())
+
+
+async def update_current_user(db: AsyncSession, user_id: int, values: dict, *criteria,
+                              conflict_detail: Optional[str] = None):
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, *criteria)
+        .values(**values, version=User.version + 1)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.scalar() is None:
+        # The user is still there, so `criteria` no longer matched: a concurrent write got in first.
+        if criteria and (await db.execute(select(User.id).where(User.id == user_id))).first() is not None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=conflict_detail)
+        raise HTTPException(status_code=404, detail="User not found")
+    await db.commit()
 
@@ -0,0 +1,112 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DDL, and_, column, event, func, literal_column, or_, select, table
+from sqlalchemy.orm import aliased
+from starlette import status
+
+from models import Todos
+from pagination import decode_cursor, encode_cursor
+
+# The index is maintained by the database itself (triggers on SQLite, a generated column on
+# Postgres), so every write to todos, bulk and admin paths included, keeps it in sync. The
+# contentless todos_fts also indexes an "owner<id>" token, so a query intersects the owner's
+# postings with the term postings instead of ranking every user's matches.
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(owner, title, description, content='')",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF owner_id, title, description ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'owner' || old.owner_id, old.title, old.description); "
+    "INSERT INTO todos_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'owner' || new.owner_id, new.title, new.description); END",
+]
+
+POSTGRES_FTS_DDL = [
+    "ALTER TABLE todos ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_todos_search_vector ON todos USING gin (search_vector)",
+]
+
+for statement in SQLITE_FTS_DDL:
+    event.listen(Todos.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_FTS_DDL:
+    event.listen(Todos.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+class SearchBackend(ABC):
+    """Builds `SELECT todos.*, score` for an owner's rows matching `q`; lower scores rank first."""
+
+    @abstractmethod
+    def ranked(self, owner_id: int, q: str):
+        ...
+
+
+class SqliteSearchBackend(SearchBackend):
+    def ranked(self, owner_id: int, q: str):
+        terms = q.split()
+        if not terms:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid search query")
+        # Quote every term so user input is matched literally instead of parsed as FTS5 syntax.
+        phrases = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        match = f"owner:owner{int(owner_id)} AND {{title description}}: ({phrases})"
+        fts = table("todos_fts", column("rowid"))
+        fts_table = literal_column("todos_fts")
+        return (
+            select(Todos, func.bm25(fts_table, 0.0, 1.0, 1.0).label("score"))
+            .join(fts, fts.c.rowid == Todos.id)
+            .where(fts_table.op("MATCH")(match))
+            .where(Todos.owner_id == owner_id)
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    def ranked(self, owner_id: int, q: str):
+        query = func.websearch_to_tsquery("english", q)
+        search_vector = literal_column("todos.search_vector")
+        return (
+            select(Todos, (-func.ts_rank(search_vector, query)).label("score"))
+            .where(search_vector.op("@@")(query))
+            .where(Todos.owner_id == owner_id)
+        )
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SqliteSearchBackend(),
+    "postgresql": PostgresSearchBackend(),
+}
+
+
+def get_search_backend(dialect_name: str) -> SearchBackend:
+    return SEARCH_BACKENDS[dialect_name]
+
+
+async def search_todos(db, owner_id: int, q: str, cursor: Optional[str], limit: int):
+    backend = get_search_backend(db.get_bind().dialect.name)
+    ranked = backend.ranked(owner_id, q).subquery()
+    todo = aliased(Todos, ranked)
+    statement = select(todo, ranked.c.score)
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if not isinstance(values.get("score"), (int, float)) or not isinstance(values.get("id"), int):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        statement = statement.where(or_(
+            ranked.c.score > values["score"],
+            and_(ranked.c.score == values["score"], ranked.c.id > values["id"])
+        ))
+    result = await db.execute(statement.order_by(ranked.c.score, ranked.c.id).limit(limit + 1))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        last_todo, last_score = rows[limit - 1]
+        next_cursor = encode_cursor({"score": last_score, "id": last_todo.id})
+    return {
+        "data": [row[0] for row in rows[:limit]],
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,104 @@
+import asyncio
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Todos, TodoStats
+
+UPSERT_DIALECTS = {
+    "sqlite": sqlite,
+    "postgresql": postgresql,
+}
+
+
+async def apply_todo_stats(db: AsyncSession, owner_id: int, added: Iterable = (), removed: Iterable = ()):
+    """Adjusts the owner's (priority, completed) counters; runs inside the caller's transaction."""
+    deltas = Counter((priority, bool(completed)) for priority, completed in added)
+    deltas.subtract((priority, bool(completed)) for priority, completed in removed)
+    rows = [
+        {"owner_id": owner_id, "priority": priority, "completed": completed, "count": delta}
+        for (priority, completed), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    upsert = UPSERT_DIALECTS[db.get_bind().dialect.name].insert(TodoStats)
+    await db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[TodoStats.owner_id, TodoStats.priority, TodoStats.completed],
+            set_={"count": TodoStats.count + upsert.excluded.count}
+        ),
+        rows
+    )
+
+
+async def get_todo_stats(db: AsyncSession, owner_id: Optional[int] = None) -> dict:
+    statement = select(TodoStats.priority, TodoStats.completed, func.sum(TodoStats.count))
+    if owner_id is not None:
+        statement = statement.where(TodoStats.owner_id == owner_id)
+    result = await db.execute(statement.group_by(TodoStats.priority, TodoStats.completed))
+
+    stats = {"total": 0, "completed": 0, "open": 0, "by_priority": {}}
+    for priority, completed, count in result.all():
+        if not count:
+            continue
+        state = "completed" if completed else "open"
+        by_priority = stats["by_priority"].setdefault(str(priority), {"completed": 0, "open": 0})
+        by_priority[state] += count
+        stats[state] += count
+        stats["total"] += count
+    return stats
+
+
+async def reconcile_todo_stats(db: AsyncSession) -> list[dict]:
+    """Rebuilds todo_stats from todos and returns every counter that had drifted.
+
+    Counter writers are held off from before todos is read until the rebuild commits, so an increment cannot
+    land in between and be wiped out by the rebuild.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Conflicts with the ROW EXCLUSIVE lock every counter upsert takes. On SQLite the DELETE below already
+        # takes the database's single write lock.
+        await db.execute(text("LOCK TABLE todo_stats IN EXCLUSIVE MODE"))
+    result = await db.execute(
+        delete(TodoStats).returning(TodoStats.owner_id, TodoStats.priority, TodoStats.completed, TodoStats.count)
+    )
+    actual = {(owner_id, priority, bool(completed)): count for owner_id, priority, completed, count in result.all()}
+    result = await db.execute(
+        select(Todos.owner_id, Todos.priority, Todos.completed, func.count())
+        .where(Todos.owner_id.is_not(None), Todos.priority.is_not(None), Todos.completed.is_not(None))
+        .group_by(Todos.owner_id, Todos.priority, Todos.completed)
+    )
+    expected = {(owner_id, priority, bool(completed)): count for owner_id, priority, completed, count in result.all()}
+
+    drift = []
+    for owner_id, priority, completed in sorted(expected.keys() | actual.keys()):
+        key = (owner_id, priority, completed)
+        if expected.get(key, 0) != actual.get(key, 0):
+            drift.append({"owner_id": owner_id, "priority": priority, "completed": completed,
+                          "expected": expected.get(key, 0), "actual": actual.get(key, 0)})
+
+    if expected:
+        await db.execute(insert(TodoStats), [
+            {"owner_id": owner_id, "priority": priority, "completed": completed, "count": count}
+            for (owner_id, priority, completed), count in expected.items()
+        ])
+    await db.commit()
+    return drift
+
+
+async def main():
+    from database import SessionLocal, dispose_engine, get_engine
+    get_engine()
+    async with SessionLocal() as db:
+        drift = await reconcile_todo_stats(db)
+    await dispose_engine()
+    for row in drift:
+        print(row)
+    print(f"{len(drift)} counters drifted")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,26 +1,48 @@
+import json
+from datetime import datetime, timedelta, timezone
+
 from fastapi import status
 
-from routers.admin import get_db, get_current_user
+from routers.admin import get_db, get_read_db, get_current_user, hash_pool
 from .utils import *
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 app.dependency_overrides[get_current_user] = override_get_current_user
 
 
 def test_get_todos(test_todo):
     response = client.get("/admin/todos")
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.json()) == 1
-    assert response.json() == [
-        {
-            "id": test_todo.id,
-            "title": test_todo.title,
-            "description": test_todo.description,
-            "priority": test_todo.priority,
-            "completed": test_todo.completed,
-            "owner_id": test_todo.owner_id
-        }
-    ]
+    assert len(response.json()["data"]) == 1
+    assert response.json() == {
+        "data": [
+            {
+                "id": test_todo.id,
+                "title": test_todo.title,
+                "description": test_todo.description,
+                "priority": test_todo.priority,
+                "completed": test_todo.completed,
+                "owner_id": test_todo.owner_id,
+                "version": test_todo.version
+            }
+        ],
+        "next_cursor": None
+    }
+
+
+def test_get_todos_pagination(test_todo):
+    db = TestSessionLocal()
+    db.add(Todos(title="Other user", description="Not mine", priority=1, completed=False, owner_id=2))
+    db.commit()
+    db.close()
+
+    first_page = client.get("/admin/todos", params={"limit": 1})
+    assert [todo["id"] for todo in first_page.json()["data"]] == [1]
+
+    second_page = client.get("/admin/todos", params={"limit": 1, "cursor": first_page.json()["next_cursor"]})
+    assert [todo["id"] for todo in second_page.json()["data"]] == [2]
+    assert second_page.json()["next_cursor"] is None
 
 
 def test_delete_todo(test_todo):
@@ -30,8 +52,162 @@ def test_delete_todo(test_todo):
     model = db.query(Todos).filter(Todos.id == 1).first()
     assert model is None
 
+def test_delete_ownerless_todo(test_todo):
+    db = TestSessionLocal()
+    todo = Todos(title="Orphan", description="No owner", priority=1, completed=False, owner_id=None)
+    db.add(todo)
+    db.commit()
+    db.refresh(todo)
+
+    response = client.delete(f"/admin/todos/{todo.id}/delete")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert db.query(Todos).filter(Todos.id == todo.id).first() is None
+    assert db.query(TodoTombstone).count() == 0
+    db.close()
+
 def test_delete_todo_not_found(test_todo):
     response = client.delete("/admin/todos/999/delete")
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "Todo not found"}
 
+
+def test_purge_refresh_tokens(test_user):
+    now = datetime.now(timezone.utc)
+    db = TestSessionLocal()
+    db.add_all([
+        RefreshToken(user_id=test_user.id, token_hash="expired", expires_at=now - timedelta(days=1), revoked=True),
+        RefreshToken(user_id=test_user.id, token_hash="spent", expires_at=now + timedelta(days=1), revoked=True),
+        RefreshToken(user_id=test_user.id, token_hash="active", expires_at=now + timedelta(days=1)),
+    ])
+    db.commit()
+
+    response = client.post("/admin/refresh-tokens/purge")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"purged": 1}
+    assert {token for token, in db.query(RefreshToken.token_hash)} == {"spent", "active"}
+    db.close()
+
+
+def test_get_hash_pool_metrics():
+    response = client.get("/admin/metrics/hash-pool")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["capacity"] == hash_pool.capacity
+    assert "wait_seconds_total" in response.json()
+    assert "run_seconds_total" in response.json()
+
+def test_export_todos_ndjson(test_todo):
+    response = client.get("/admin/todos/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {
+            "id": test_todo.id,
+            "title": test_todo.title,
+            "description": test_todo.description,
+            "priority": test_todo.priority,
+            "completed": test_todo.completed,
+            "owner_id": test_todo.owner_id,
+            "version": test_todo.version,
+            "changed_version": test_todo.changed_version
+        }
+    ]
+
+
+def test_export_todos_csv(test_todo):
+    response = client.get("/admin/todos/export", params={"format": "csv"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == [
+        "id,title,description,priority,completed,owner_id,version,changed_version",
+        "1,Learn fastAPI,Because it's awesome,5,False,1,1,0",
+    ]
+
+
+def test_delete_todo_invalidates_owner_cache(test_todo):
+    assert len(client.get("/todos").json()["data"]) == 1
+    client.delete("/admin/todos/1/delete")
+    assert client.get("/todos").json()["data"] == []
+
+
+def test_get_todo_cache_metrics():
+    response = client.get("/admin/metrics/todo-cache")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["backend"] == "InMemoryCacheBackend"
+    assert {"hits", "misses", "invalidations"} <= response.json().keys()
+
+
+def test_get_auth_admission_metrics():
+    response = client.get("/admin/metrics/auth-admission")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["shed"].keys() == {"concurrency", "ip", "email"}
+
+
+def test_get_db_pool_metrics(monkeypatch):
+    monkeypatch.setattr("routers.admin.get_engine", lambda: async_engine)
+    response = client.get("/admin/metrics/db-pool")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["profile"] in ("server", "serverless")
+    assert {"checked_out", "overflow", "checkout_wait_seconds_total"} <= response.json().keys()
+
+
+def test_get_db_replica_metrics():
+    response = client.get("/admin/metrics/db-replicas")
+    assert response.status_code == status.HTTP_200_OK
+    assert {"replicas", "healthy", "replica_reads", "primary_reads", "fallbacks"} <= response.json().keys()
+
+
+def test_reconcile_stats_reports_drift(test_todo):
+    # test_todo is inserted behind the API's back, so its counter is missing.
+    response = client.post("/admin/stats/reconcile")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "drifted": 1,
+        "drift": [{"owner_id": 1, "priority": 5, "completed": False, "expected": 1, "actual": 0}]
+    }
+    assert client.post("/admin/stats/reconcile").json()["drifted"] == 0
+
+    client.delete(f"/admin/todos/{test_todo.id}/delete")
+    response = client.get("/admin/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"total": 0, "completed": 0, "open": 0, "by_priority": {}}
+
+
+def test_import_users(test_user, monkeypatch):
+    monkeypatch.setattr("user_import.IMPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr("user_import.hashing_policy.rounds", 4)
+    upload = "\n".join([
+        "email,username,first_name,last_name,password,phone_number",
+        "ana@gmail.com,ana,Ana,Lee,secret1,0811",
+        "fyan@gmail.com,someone,Dup,Email,secret2,0812",
+        "budi@gmail.com,budi,Budi,Santoso,secret3",
+        "",
+        "cici@gmail.com,ana,Cici,Dup,secret4,0814",
+        "dodi@gmail.com,dodi,Dodi,Tan,secret5,0815",
+    ])
+    response = client.post("/admin/users/import", params={"format": "csv"}, content=upload.encode())
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line["row"], line["status"]) for line in lines[:-1]] == [
+        (1, "created"), (2, "duplicate"), (3, "invalid"), (4, "duplicate"), (5, "created")
+    ]
+    assert lines[-1] == {"summary": {"created": 2, "duplicate": 2, "invalid": 1}}
+
+    db = TestSessionLocal()
+    imported = db.query(User).filter(User.email == "dodi@gmail.com").first()
+    db.close()
+    assert imported.role == "user"
+    assert verify_password("secret5", imported.hashed_password)
+
+
+def test_import_users_ndjson(test_user, monkeypatch):
+    monkeypatch.setattr("user_import.hashing_policy.rounds", 4)
+    upload = "\n".join([
+        json.dumps({"email": "ana@gmail.com", "username": "ana", "first_name": "Ana", "last_name": "Lee",
+                    "password": "secret1", "phone_number": "0811"}),
+        "not json",
+    ])
+    response = client.post("/admin/users/import", content=upload.encode())
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"row": 1, "status": "created"}
+    assert lines[1]["status"] == "invalid"
+    assert lines[-1] == {"summary": {"created": 1, "duplicate": 0, "invalid": 1}}
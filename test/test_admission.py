@@ -0,0 +1,62 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from admission import AdmissionController, InMemoryRateLimitStore, client_ip
+
+
+def make_controller(**limits) -> AdmissionController:
+    options = {"max_concurrent": 2, "email_rate_per_minute": 60, "email_burst": 2, "ip_rate_per_minute": 60,
+               "ip_burst": 10, **limits}
+    return AdmissionController(InMemoryRateLimitStore(max_keys=100), **options)
+
+
+@pytest.mark.asyncio
+async def test_email_bucket_sheds_after_burst():
+    controller = make_controller()
+    for _ in range(2):
+        async with controller.admit("10.0.0.1", "fyan@gmail.com"):
+            pass
+    with pytest.raises(HTTPException) as error:
+        async with controller.admit("10.0.0.1", "FYAN@gmail.com "):
+            pass
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+    async with controller.admit("10.0.0.1", "other@gmail.com"):
+        pass
+    assert controller.metrics()["admitted"] == 3
+    assert controller.metrics()["shed"] == {"concurrency": 0, "ip": 0, "email": 1}
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_sheds_while_full():
+    controller = make_controller(max_concurrent=1)
+    async with controller.admit("10.0.0.1", "a@gmail.com"):
+        with pytest.raises(HTTPException):
+            async with controller.admit("10.0.0.2", "b@gmail.com"):
+                pass
+    async with controller.admit("10.0.0.2", "b@gmail.com"):
+        assert controller.metrics()["in_flight"] == 1
+    assert controller.metrics()["shed"]["concurrency"] == 1
+
+
+@pytest.mark.asyncio
+async def test_store_evicts_least_recently_used_keys():
+    store = InMemoryRateLimitStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        assert await store.take(key, 1, 1) == 0
+    assert list(store.buckets) == ["b", "c"]
+    assert await store.take("c", 1, 1) > 0
+
+
+def test_client_ip_uses_entry_appended_by_trusted_proxy(monkeypatch):
+    request = Request({"type": "http", "client": ("10.0.0.9", 443),
+                       "headers": [(b"x-forwarded-for", b"1.2.3.4, 203.0.113.7, 10.0.0.5")]})
+    assert client_ip(request) == "10.0.0.9"
+
+    monkeypatch.setattr("admission.TRUST_FORWARDED_FOR", True)
+    assert client_ip(request) == "10.0.0.5"
+    monkeypatch.setattr("admission.TRUSTED_PROXY_HOPS", 2)
+    assert client_ip(request) == "203.0.113.7"
+    monkeypatch.setattr("admission.TRUSTED_PROXY_HOPS", 5)
+    assert client_ip(request) == "1.2.3.4"
@@ -4,25 +4,26 @@ from fastapi import HTTPException
 from jose import jwt
 from starlette import status
 
-from routers.auth import get_db, authenticate_user, create_access_token, ALGORITHM, SECRET_KEY, get_current_user
+from admission import AdmissionController, InMemoryRateLimitStore
+from routers.auth import get_db, authenticate_user, create_access_token, ALGORITHM, SECRET_KEY, get_current_user, \
+    verified_token_cache, hash_pool
 from .utils import *
 
 app.dependency_overrides[get_db] = override_get_db
 
 
-def test_authenticate_user(test_user):
-    db = TestSessionLocal()
-    authenticated_user = authenticate_user(test_user.email, "admin123", db)
-    assert authenticated_user is not None
-    assert authenticated_user.email == test_user.email
+@pytest.mark.asyncio
+async def test_authenticate_user(test_user):
+    async with TestAsyncSessionLocal() as db:
+        authenticated_user = await authenticate_user(test_user.email, "admin123", db)
+        assert authenticated_user is not None
+        assert authenticated_user.email == test_user.email
 
-    not_authenticated_email = authenticate_user("fyantest@gmail.com", "admin123", db)
-    assert not_authenticated_email is False
+        not_authenticated_email = await authenticate_user("fyantest@gmail.com", "admin123", db)
+        assert not_authenticated_email is False
 
-    not_authenticated_password = authenticate_user(test_user.email, "test123", db)
-    assert not_authenticated_password is False
-
-    db.close()
+        not_authenticated_password = await authenticate_user(test_user.email, "test123", db)
+        assert not_authenticated_password is False
 
 
 def test_create_access_token(test_user):
@@ -60,6 +61,28 @@ async def test_get_current_user_no_token(test_user):
     assert e.value.detail == "Invalid credentials"
 
 
+@pytest.mark.asyncio
+async def test_get_current_user_cached(test_user):
+    verified_token_cache.clear()
+    token = create_access_token(test_user.email, test_user.id, test_user.role, timedelta(minutes=10))
+    first = await get_current_user(token=token)
+    hits = verified_token_cache.hits
+
+    second = await get_current_user(token=token)
+    assert second == first
+    assert verified_token_cache.hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cache_expired(test_user):
+    verified_token_cache.clear()
+    token = create_access_token(test_user.email, test_user.id, test_user.role, timedelta(minutes=10))
+    verified_token_cache.set(token, {"email": "stale", "user_id": 0, "role": None}, datetime.now().timestamp() - 1)
+
+    current_user = await get_current_user(token=token)
+    assert current_user["email"] == test_user.email
+
+
 def test_create_user(test_user):
     request_body = {
         "email": "newfyan@gmail.com",
@@ -81,7 +104,7 @@ def test_create_user(test_user):
     assert model.last_name == request_body["last_name"]
     assert model.phone_number == request_body["phone_number"]
     assert model.role == request_body["role"]
-    assert bcrypt_context.verify("test123", model.hashed_password)
+    assert verify_password("test123", model.hashed_password)
     db.close()
 
 
@@ -111,6 +134,7 @@ def test_login(test_user):
     assert "access_token" in response.json()
     assert response.json()["access_token"] is not None
     assert response.json()["token_type"] == "bearer"
+    assert response.json()["refresh_token"] is not None
 
 
 def test_login_failed(test_user):
@@ -122,3 +146,74 @@ def test_login_failed(test_user):
                            headers={"Content-Type": "application/x-www-form-urlencoded"})
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
     assert response.json() == {"detail": "Invalid credentials"}
+
+
+def login(user) -> dict:
+    response = client.post("/auth/login", data={"username": user.email, "password": "admin123"},
+                           headers={"Content-Type": "application/x-www-form-urlencoded"})
+    return response.json()
+
+
+def test_refresh_rotates_without_hashing(test_user):
+    tokens = login(test_user)
+    hashed = hash_pool.completed
+    with assert_max_queries(3):
+        response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_200_OK
+    assert hash_pool.completed == hashed
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    payload = jwt.decode(refreshed["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["user_id"] == test_user.id
+    assert payload["email"] == test_user.email
+
+
+def test_refresh_reuse_revokes_all_tokens(test_user):
+    tokens = login(test_user)
+    refreshed = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json() == {"detail": "Invalid refresh token"}
+    response = client.post("/auth/refresh", json={"refresh_token": refreshed["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_revoke_refresh_token(test_user):
+    tokens = login(test_user)
+    response = client.post("/auth/revoke", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_login_shed_before_hashing(test_user, monkeypatch):
+    controller = AdmissionController(InMemoryRateLimitStore(max_keys=10), max_concurrent=4, email_rate_per_minute=1,
+                                     email_burst=1, ip_rate_per_minute=60, ip_burst=10)
+    monkeypatch.setattr("routers.auth.auth_admission", controller)
+    assert "access_token" in login(test_user)
+
+    hashed = hash_pool.completed
+    response = client.post("/auth/login", data={"username": test_user.email, "password": "admin123"},
+                           headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert "Retry-After" in response.headers
+    assert hash_pool.completed == hashed
+
+
+def test_login_rehashes_when_cost_rises(test_user, monkeypatch):
+    db = TestSessionLocal()
+    db.query(User).filter(User.id == test_user.id).update({"hashed_password": hash_password("admin123", 4)})
+    db.commit()
+
+    monkeypatch.setattr("routers.auth.hashing_policy.rounds", 5)
+    assert "access_token" in login(test_user)
+    hashed_password = db.query(User.hashed_password).filter(User.id == test_user.id).scalar()
+    assert hashed_password.startswith("$2b$05$")
+    assert verify_password("admin123", hashed_password)
+
+    # A lower policy cost never downgrades an existing hash.
+    monkeypatch.setattr("routers.auth.hashing_policy.rounds", 4)
+    assert "access_token" in login(test_user)
+    assert db.query(User.hashed_password).filter(User.id == test_user.id).scalar() == hashed_password
+    db.close()
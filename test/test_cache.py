@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from cache import InMemoryCacheBackend, TodoListCache, VerifiedTokenCache
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_and_miss():
+    cache = TodoListCache(InMemoryCacheBackend(max_owners=2, max_pages_per_owner=2, ttl_seconds=60))
+    assert await cache.get(1, "None:50") is None
+    await cache.set(1, "None:50", b"[]")
+    assert await cache.get(1, "None:50") == b"[]"
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidate():
+    cache = TodoListCache(InMemoryCacheBackend(max_owners=2, max_pages_per_owner=2, ttl_seconds=60))
+    await cache.set(1, "None:50", b"[]")
+    await cache.set(2, "None:50", b"[]")
+    await cache.invalidate(1)
+    assert await cache.get(1, "None:50") is None
+    assert await cache.get(2, "None:50") == b"[]"
+
+
+@pytest.mark.asyncio
+async def test_cache_lru_eviction():
+    backend = InMemoryCacheBackend(max_owners=2, max_pages_per_owner=2, ttl_seconds=60)
+    await backend.set(1, "a", b"1")
+    await backend.set(2, "a", b"2")
+    await backend.get(1, "a")
+    await backend.set(3, "a", b"3")
+    assert await backend.get(2, "a") is None
+    assert await backend.get(1, "a") == b"1"
+    assert backend.evictions == 1
+
+    await backend.set(1, "b", b"1")
+    await backend.set(1, "c", b"1")
+    assert await backend.get(1, "a") is None
+
+
+@pytest.mark.asyncio
+async def test_cache_byte_budget():
+    backend = InMemoryCacheBackend(max_owners=4, max_pages_per_owner=4, ttl_seconds=60, max_bytes=10)
+    await backend.set(1, "a", b"1234")
+    await backend.set(2, "a", b"1234")
+    await backend.get(1, "a")
+    await backend.set(3, "a", b"1234")
+    assert await backend.get(2, "a") is None
+    assert await backend.get(1, "a") == b"1234"
+    assert backend.size == 8
+    assert backend.evictions == 1
+
+    await backend.set(3, "b", b"12345678")
+    assert await backend.get(3, "a") is None
+    assert await backend.get(3, "b") == b"12345678"
+    assert backend.size == 8
+
+    await backend.set(4, "a", b"12345678901")
+    assert await backend.get(4, "a") is None
+    assert backend.size == 0
+    assert backend.entries == {}
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl_expiry():
+    backend = InMemoryCacheBackend(max_owners=2, max_pages_per_owner=2, ttl_seconds=0)
+    await backend.set(1, "a", b"1")
+    assert await backend.get(1, "a") is None
+
+
+def test_verified_token_cache_lru():
+    cache = VerifiedTokenCache(max_entries=1)
+    cache.set("token-a", {"user_id": 1}, time.time() + 60)
+    assert cache.get("token-a") == {"user_id": 1}
+    cache.set("token-b", {"user_id": 2}, time.time() + 60)
+    assert cache.get("token-a") is None
+    assert cache.get("token-b") == {"user_id": 2}
+    assert cache.metrics() == {"entries": 1, "hits": 2, "misses": 1}
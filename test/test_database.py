@@ -0,0 +1,166 @@
+import os
+import tempfile
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+import database
+from database import InMemoryStickyStore, PoolMetrics, ReplicaRouter, get_async_database_url, get_db, \
+    get_pool_options, get_read_db, redact_parameters, statement_shape, sticky_key
+from routers.auth import create_access_token, get_current_user
+from .utils import *
+
+
+def test_get_async_database_url():
+    assert get_async_database_url("sqlite:///./todos_app.db") == "sqlite+aiosqlite:///./todos_app.db"
+    assert get_async_database_url("postgresql://zero:pw@localhost:5432/todo_app") == \
+        "postgresql+asyncpg://zero:pw@localhost:5432/todo_app"
+
+
+def test_get_pool_options():
+    assert get_pool_options("serverless")["pool_size"] == 1
+    assert get_pool_options("serverless")["max_overflow"] == 0
+    assert get_pool_options("serverless")["pool_pre_ping"] is True
+    assert get_pool_options("server")["pool_size"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics():
+    metered_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", pool_size=1, max_overflow=0)
+    metrics = PoolMetrics("server")
+    metrics.attach(metered_engine.sync_engine)
+
+    async with metered_engine.connect():
+        assert metrics.snapshot(metered_engine.pool)["checked_out"] == 1
+    snapshot = metrics.snapshot(metered_engine.pool)
+    assert snapshot["checked_out"] == 0
+    assert snapshot["connects"] == 1
+    assert snapshot["size"] == 1
+    await metered_engine.dispose()
+
+
+def test_statement_shape_collapses_in_lists():
+    assert statement_shape("SELECT id FROM todos\n WHERE id IN (?, ?, ?)") == "SELECT id FROM todos WHERE id IN (?)"
+    assert statement_shape("SELECT id FROM todos WHERE id IN ($1, $2)") == "SELECT id FROM todos WHERE id IN (?)"
+
+
+def test_redact_parameters():
+    assert redact_parameters((1, "secret")) == ["int", "str"]
+    assert redact_parameters({"password": "secret"}) == {"password": "str"}
+    assert redact_parameters([(1,), (2,)], executemany=True) == "<2 parameter sets>"
+
+
+@pytest.mark.asyncio
+async def test_query_tracking_flags_repeated_statements(test_todo):
+    with track_queries() as outer:
+        with track_queries() as inner:
+            async with TestAsyncSessionLocal() as db:
+                for todo_id in range(3):
+                    await db.execute(select(Todos.title).where(Todos.id == todo_id))
+    assert inner.count == outer.count == 3
+    assert inner.repeated(threshold=2) == {"SELECT todos.title FROM todos WHERE todos.id = ?": 3}
+
+
+def make_request(method: str, user_id: int = 1, expires_minutes: int = 10) -> Request:
+    token = create_access_token("fyan@gmail.com", user_id, "user", timedelta(minutes=expires_minutes))
+    return Request({"type": "http", "method": method, "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def test_sticky_key_is_the_token_user():
+    assert sticky_key(make_request("GET")) == sticky_key(make_request("GET", expires_minutes=20)) == "user:1"
+    assert sticky_key(make_request("GET", user_id=2)) == "user:2"
+    assert sticky_key(Request({"type": "http", "headers": [(b"authorization", b"Bearer not-a-jwt")]})) is None
+    assert sticky_key(Request({"type": "http", "headers": []})) is None
+
+
+async def read_title(request: Request) -> str:
+    dependency = get_read_db(request)
+    db = await anext(dependency)
+    try:
+        return (await db.execute(select(Todos.title).where(Todos.title.startswith("from ")))).scalar_one()
+    finally:
+        await anext(dependency, None)
+
+
+@pytest.fixture
+def replica(test_todo, monkeypatch):
+    """A second SQLite file standing in for a replica that lags the primary."""
+    path = os.path.join(tempfile.mkdtemp(), "replica.db")
+    replica_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=replica_engine)
+    with replica_engine.begin() as conn:
+        conn.execute(Todos.__table__.insert().values(title="from replica", priority=1, completed=False, owner_id=1))
+    replica_engine.dispose()
+    with TestSessionLocal() as db:
+        db.add(Todos(title="from primary", priority=1, completed=False, owner_id=1))
+        db.commit()
+
+    router = ReplicaRouter([f"sqlite:///{path}"], sticky_seconds=60, retry_seconds=60,
+                           store=InMemoryStickyStore(max_keys=10))
+    monkeypatch.setattr(database, "engine", async_engine)
+    monkeypatch.setattr(database, "SessionLocal", TestAsyncSessionLocal)
+    monkeypatch.setattr(database, "replica_router", router)
+    yield router
+    asyncio.run(router.dispose())
+
+
+async def write(request: Request, authenticate: bool = True):
+    """Runs a write handler's dependencies: get_db, and the auth dependency that verifies the bearer token."""
+    dependency = get_db(request)
+    await anext(dependency)
+    try:
+        if authenticate:
+            await get_current_user(request.headers["authorization"].partition(" ")[2], request)
+    finally:
+        await anext(dependency, None)
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_until_caller_writes(replica):
+    assert await read_title(make_request("GET")) == "from replica"
+
+    await write(make_request("POST"))
+
+    # A refreshed access token for the same user stays on the primary.
+    assert await read_title(make_request("GET", expires_minutes=20)) == "from primary"
+    assert await read_title(make_request("GET", user_id=2)) == "from replica"
+    assert replica.metrics()["sticky_reads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unverified_writes_do_not_stick(replica):
+    # A route without an auth dependency, such as POST /auth/refresh, never verifies the bearer token.
+    await write(make_request("POST"), authenticate=False)
+
+    forged = jwt.encode({"email": "x@gmail.com", "user_id": 2, "role": "user"}, "not-the-secret", algorithm="HS256")
+    request = Request({"type": "http", "method": "POST", "headers": [(b"authorization", f"Bearer {forged}".encode())]})
+    with pytest.raises(HTTPException):
+        await write(request)
+
+    assert replica.store.sticky_until == {}
+    assert await read_title(make_request("GET")) == "from replica"
+    assert await read_title(request) == "from replica"
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_replica_falls_back_to_primary(test_todo, monkeypatch):
+    with TestSessionLocal() as db:
+        db.add(Todos(title="from primary", priority=1, completed=False, owner_id=1))
+        db.commit()
+    missing = os.path.join(tempfile.mkdtemp(), "missing", "replica.db")
+    router = ReplicaRouter([f"sqlite:///{missing}"], sticky_seconds=60, retry_seconds=60,
+                           store=InMemoryStickyStore(max_keys=10))
+    monkeypatch.setattr(database, "engine", async_engine)
+    monkeypatch.setattr(database, "SessionLocal", TestAsyncSessionLocal)
+    monkeypatch.setattr(database, "replica_router", router)
+
+    assert await read_title(make_request("GET")) == "from primary"
+    assert await read_title(make_request("GET")) == "from primary"
+    assert router.metrics() == {"replicas": 1, "healthy": 0, "replica_reads": 0, "primary_reads": 2,
+                                "sticky_reads": 0, "fallbacks": 1}
+    await router.dispose()
@@ -0,0 +1,11 @@
+from etag import etag_matches, make_etag
+
+
+def test_etag_matches():
+    etag = make_etag("todo", 1, 3)
+    assert etag == '"todo-1-3"'
+    assert etag_matches('"todo-1-3"', etag)
+    assert etag_matches('"todo-1-2", W/"todo-1-3"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"todo-1-2"', etag)
+    assert not etag_matches(None, etag)
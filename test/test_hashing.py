@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+from fastapi import HTTPException
+
+from hashing import HashingPolicy, HashPool, calibrate_rounds, hash_password, password_needs_update, verify_password
+from .utils import *
+
+
+@pytest.mark.asyncio
+async def test_hash_pool_run():
+    pool = HashPool("thread", workers=1, max_queue=0, retry_after=1)
+    hashed_password = await pool.run(hash_password, "admin123")
+    assert await pool.run(verify_password, "admin123", hashed_password)
+    assert not await pool.run(verify_password, "test123", hashed_password)
+
+    metrics = pool.metrics()
+    assert metrics["completed"] == 3
+    assert metrics["in_flight"] == 0
+    assert metrics["run_seconds_total"] > 0
+    assert metrics["wait_seconds_max"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_hash_pool_saturated():
+    pool = HashPool("thread", workers=1, max_queue=0, retry_after=3)
+    release = threading.Event()
+    busy = asyncio.ensure_future(pool.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as e:
+        await pool.run(hash_password, "admin123")
+
+    assert e.value.status_code == 503
+    assert e.value.headers == {"Retry-After": "3"}
+    assert pool.metrics()["rejected"] == 1
+
+    release.set()
+    assert await busy is True
+
+
+@pytest.mark.asyncio
+async def test_process_hash_pool_starts_workers_from_forkserver():
+    pool = HashPool("process", workers=1, max_queue=0, retry_after=1)
+    try:
+        assert pool.executor._mp_context.get_start_method() == "forkserver"
+        assert verify_password("admin123", await pool.run(hash_password, "admin123", 4))
+    finally:
+        pool.executor.shutdown()
+
+
+def test_password_needs_update_only_when_cost_rises():
+    hashed_password = hash_password("admin123", 5)
+    assert hashed_password.startswith("$2b$05$")
+    assert verify_password("admin123", hashed_password)
+    assert not password_needs_update(hashed_password, 5)
+    assert password_needs_update(hashed_password, 6)
+    assert not password_needs_update(hashed_password, 4)
+
+
+def test_calibrate_rounds_stays_within_bounds():
+    assert calibrate_rounds(0, 4, 6) == 4
+    assert calibrate_rounds(3600, 4, 6) == 6
+
+
+def test_hashing_policy_calibrates_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr("hashing.BCRYPT_ROUNDS", None)
+    monkeypatch.setattr("hashing.BCRYPT_TARGET_MS", 1.0)
+    monkeypatch.setattr("hashing.calibrate_rounds", lambda *args: calls.append(args) or 4)
+    policy = HashingPolicy(12, "default")
+    policy.configure()
+    policy.configure()
+    assert len(calls) == 1
+    assert policy.metrics() == {"rounds": 4, "source": "calibrated"}
@@ -1,8 +1,60 @@
 from fastapi.testclient import TestClient
-from api.main import app
+
+import database
+from api.main import app, mangum
+from database import PoolMetrics, get_read_db
+from routers.auth import get_current_user
+from .utils import *
 
 def test_healthy():
     client = TestClient(app)
     response = client.get("/healthy")
     assert response.status_code == 200
-    assert response.json() == {"message": "healthy"}
\ No newline at end of file
+    assert response.json() == {"message": "healthy"}
+
+def test_server_timing_and_metrics():
+    client = TestClient(app)
+    response = client.get("/healthy")
+    assert "total;dur=" in response.headers["server-timing"]
+    assert "serialize;dur=" in response.headers["server-timing"]
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'todo_api_request_phase_seconds_count{method="GET",route="/healthy",phase="total"}' in metrics.text
+
+
+def invoke(handler, path: str) -> dict:
+    event = {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "todo.example"},
+        "requestContext": {"http": {"method": "GET", "path": path, "protocol": "HTTP/1.1", "sourceIp": "10.0.0.1"},
+                           "stage": "$default"},
+        "isBase64Encoded": False,
+    }
+    return handler(event, None)
+
+
+def test_mangum_keeps_warm_connection_between_invocations(test_user, monkeypatch):
+    warm_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", pool_size=1, max_overflow=0)
+    metrics = PoolMetrics("serverless")
+    metrics.attach(warm_engine.sync_engine)
+    monkeypatch.setattr(database, "engine", warm_engine)
+    monkeypatch.setattr(database, "SessionLocal", async_sessionmaker(bind=warm_engine, expire_on_commit=False))
+    monkeypatch.delitem(app.dependency_overrides, get_read_db, raising=False)
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, override_get_current_user)
+
+    # Like the Lambda runtime, every invocation runs on the same event loop.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        for _ in range(2):
+            assert invoke(mangum, "/user/")["statusCode"] == 200
+        assert metrics.connects == 1
+        loop.run_until_complete(warm_engine.dispose())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,50 @@
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from .utils import *
+
+
+def query_plan(statement):
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return " ".join(row[-1] for row in rows)
+
+
+def test_owner_scoped_list_uses_owner_id_index(test_todo):
+    plan = query_plan(select(Todos).where(Todos.owner_id == 1).where(Todos.id > 0).order_by(Todos.id).limit(51))
+    assert "ix_todos_owner_id_id" in plan
+    assert "USE TEMP B-TREE" not in plan
+
+
+def test_owner_scoped_lookup_uses_owner_id_index(test_todo):
+    plan = query_plan(select(Todos).where(Todos.id == 1).where(Todos.owner_id == 1))
+    assert "SCAN" not in plan
+
+
+def test_filtered_list_uses_owner_id_completed_priority_index(test_todo):
+    plan = query_plan(select(Todos).where(Todos.owner_id == 1).where(Todos.completed.is_(False))
+                      .where(Todos.priority >= 3))
+    assert "ix_todos_owner_id_completed_priority" in plan
+
+
+def test_top_todos_read_index_in_order(test_todo):
+    plan = query_plan(select(Todos).where(Todos.owner_id == 1).where(Todos.completed.is_(False))
+                      .order_by(Todos.priority.desc(), Todos.id.desc()).limit(10))
+    assert "ix_todos_owner_id_completed_priority" in plan
+    assert "USE TEMP B-TREE" not in plan
+
+
+def test_priority_sort_without_completed_reads_index_in_order(test_todo):
+    plan = query_plan(select(Todos).where(Todos.owner_id == 1)
+                      .order_by(Todos.priority.desc(), Todos.id.desc()).limit(51))
+    assert "ix_todos_owner_id_priority_id" in plan
+    assert "USE TEMP B-TREE" not in plan
+
+
+def test_todo_priority_is_required(test_todo):
+    db = TestSessionLocal()
+    db.add(Todos(title="No priority", description="Unsortable", completed=False, owner_id=1))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.close()
@@ -1,25 +1,113 @@
+from datetime import datetime, timedelta, timezone
+
 from fastapi import status
 
-from routers.todos import get_db, get_current_user
+from models import TodoTombstone
+from routers.todos import get_db, get_read_db, get_current_user, todo_list_cache
 from .utils import *
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 app.dependency_overrides[get_current_user] = override_get_current_user
 
 
 def test_get_todos(test_todo):
     response = client.get("/todos")
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == [
-        {
-            "id": test_todo.id,
-            "title": test_todo.title,
-            "description": test_todo.description,
-            "priority": test_todo.priority,
-            "completed": test_todo.completed,
-            "owner_id": test_todo.owner_id
-        }
-    ]
+    assert response.json() == {
+        "data": [
+            {
+                "id": test_todo.id,
+                "title": test_todo.title,
+                "description": test_todo.description,
+                "priority": test_todo.priority,
+                "completed": test_todo.completed,
+                "owner_id": test_todo.owner_id,
+                "version": test_todo.version
+            }
+        ],
+        "next_cursor": None
+    }
+
+
+def test_get_todos_pagination(test_todo):
+    db = TestSessionLocal()
+    db.add_all([
+        Todos(title="Learn SQL", description="Joins", priority=3, completed=False, owner_id=1),
+        Todos(title="Learn Redis", description="Caching", priority=2, completed=False, owner_id=1),
+        Todos(title="Other user", description="Not mine", priority=1, completed=False, owner_id=2),
+    ])
+    db.commit()
+    db.close()
+
+    first_page = client.get("/todos", params={"limit": 2})
+    assert first_page.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in first_page.json()["data"]] == [1, 2]
+    assert first_page.json()["next_cursor"] is not None
+
+    second_page = client.get("/todos", params={"limit": 2, "cursor": first_page.json()["next_cursor"]})
+    assert second_page.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in second_page.json()["data"]] == [3]
+    assert second_page.json()["next_cursor"] is None
+
+
+def test_get_todos_invalid_cursor(test_todo):
+    response = client.get("/todos", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def add_priority_todos():
+    db = TestSessionLocal()
+    db.add_all([
+        Todos(title="Learn SQL", description="Joins", priority=3, completed=False, owner_id=1),
+        Todos(title="Learn Redis", description="Caching", priority=5, completed=True, owner_id=1),
+        Todos(title="Learn Docker", description="Images", priority=3, completed=False, owner_id=1),
+        Todos(title="Learn Git", description="Rebase", priority=1, completed=False, owner_id=1),
+        Todos(title="Other user", description="Not mine", priority=5, completed=False, owner_id=2),
+    ])
+    db.commit()
+    db.close()
+
+
+def test_get_todos_filtered(test_todo):
+    add_priority_todos()
+    response = client.get("/todos", params={"completed": False, "min_priority": 2, "max_priority": 4})
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in response.json()["data"]] == [2, 4]
+
+    response = client.get("/todos", params={"completed": True})
+    assert [todo["id"] for todo in response.json()["data"]] == [3]
+
+
+def test_get_todos_sorted_by_priority_pagination(test_todo):
+    add_priority_todos()
+    first_page = client.get("/todos", params={"sort": "priority", "completed": False, "limit": 2})
+    assert first_page.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in first_page.json()["data"]] == [1, 4]
+
+    second_page = client.get("/todos", params={"sort": "priority", "completed": False, "limit": 2,
+                                               "cursor": first_page.json()["next_cursor"]})
+    assert [todo["id"] for todo in second_page.json()["data"]] == [2, 5]
+    assert second_page.json()["next_cursor"] is None
+
+
+def test_get_todos_invalid_filters(test_todo):
+    response = client.get("/todos", params={"min_priority": 4, "max_priority": 2})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid priority range"}
+
+    add_priority_todos()
+    id_cursor = client.get("/todos", params={"limit": 1}).json()["next_cursor"]
+    response = client.get("/todos", params={"sort": "priority", "cursor": id_cursor})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_get_top_todos(test_todo):
+    add_priority_todos()
+    response = client.get("/todos/top", params={"k": 3})
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in response.json()] == [1, 4, 2]
 
 
 def test_get_todo(test_todo):
@@ -31,7 +119,8 @@ def test_get_todo(test_todo):
         "description": test_todo.description,
         "priority": test_todo.priority,
         "completed": test_todo.completed,
-        "owner_id": test_todo.owner_id
+        "owner_id": test_todo.owner_id,
+        "version": test_todo.version
     }
 
 
@@ -103,3 +192,352 @@ def test_delete_todo_not_found(test_todo):
     response = client.delete("/todos/999/delete")
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "Todo not found"}
+
+
+def test_add_todos(test_todo):
+    request_body = {
+        "items": [
+            {"title": "Learn SQL", "description": "Joins and indexes", "priority": 3, "completed": False},
+            {"title": "Learn Redis", "description": "Caching", "priority": 2, "completed": True},
+        ]
+    }
+    response = client.post("/todos/bulk", json=request_body)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [todo["title"] for todo in response.json()["data"]] == ["Learn SQL", "Learn Redis"]
+    db = TestSessionLocal()
+    models = db.query(Todos).filter(Todos.id.in_([2, 3])).order_by(Todos.id).all()
+    assert [model.title for model in models] == ["Learn SQL", "Learn Redis"]
+    assert all(model.owner_id == 1 for model in models)
+    db.close()
+
+
+def test_add_todos_invalid_item(test_todo):
+    request_body = {
+        "items": [
+            {"title": "Learn SQL", "description": "Joins and indexes", "priority": 3, "completed": False},
+            {"title": "No", "description": "Too short title", "priority": 2, "completed": False},
+        ]
+    }
+    response = client.post("/todos/bulk", json=request_body)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    db = TestSessionLocal()
+    assert db.query(Todos).count() == 1
+    db.close()
+
+
+def test_update_todos(test_todo):
+    db = TestSessionLocal()
+    db.add(Todos(title="Other user", description="Not mine", priority=1, completed=False, owner_id=2))
+    db.commit()
+    db.close()
+
+    request_body = {
+        "items": [
+            {"id": 1, "title": "Learn PostgreSQL", "description": "Because it's best DBMS", "priority": 2,
+             "completed": True},
+            {"id": 2, "title": "Hijack", "description": "Someone else's todo", "priority": 1, "completed": True},
+        ]
+    }
+    response = client.patch("/todos/bulk", json=request_body)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"] == [{"id": 1, "status": "updated"}, {"id": 2, "status": "not_found"}]
+    db = TestSessionLocal()
+    model = db.query(Todos).filter(Todos.id == 1).first()
+    assert model.title == "Learn PostgreSQL"
+    assert model.priority == 2
+    assert model.completed is True
+    assert db.query(Todos).filter(Todos.id == 2).first().title == "Other user"
+    db.close()
+
+
+def test_delete_todos(test_todo):
+    response = client.request("DELETE", "/todos/bulk", json={"ids": [1, 999]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"] == [{"id": 1, "status": "deleted"}, {"id": 999, "status": "not_found"}]
+    db = TestSessionLocal()
+    assert db.query(Todos).filter(Todos.id == 1).first() is None
+    db.close()
+
+
+def test_get_todos_cached(test_todo):
+    first = client.get("/todos")
+    hits = todo_list_cache.hits
+
+    db = TestSessionLocal()
+    db.query(Todos).filter(Todos.id == 1).update({"title": "Changed behind the cache"})
+    db.commit()
+    db.close()
+
+    second = client.get("/todos")
+    assert second.status_code == status.HTTP_200_OK
+    assert second.json() == first.json()
+    assert todo_list_cache.hits == hits + 1
+
+
+def test_get_todos_cache_invalidated_on_write(test_todo):
+    client.get("/todos")
+    request_body = {
+        "title": "Learn PostgreSQL",
+        "description": "Because it's best DBMS",
+        "priority": 3,
+        "completed": False
+    }
+    client.post("/todos/add", json=request_body)
+
+    response = client.get("/todos")
+    assert [todo["title"] for todo in response.json()["data"]] == ["Learn fastAPI", "Learn PostgreSQL"]
+
+
+def test_get_todos_not_modified(test_user, test_todo):
+    response = client.get("/todos")
+    etag = response.headers["ETag"]
+
+    not_modified = client.get("/todos", headers={"If-None-Match": etag})
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified.headers["ETag"] == etag
+
+    client.delete("/todos/1/delete")
+    modified = client.get("/todos", headers={"If-None-Match": etag})
+    assert modified.status_code == status.HTTP_200_OK
+    assert modified.headers["ETag"] != etag
+    assert modified.json()["data"] == []
+
+
+def test_get_todo_not_modified(test_todo):
+    response = client.get("/todos/1")
+    etag = response.headers["ETag"]
+
+    not_modified = client.get("/todos/1", headers={"If-None-Match": etag})
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+
+    request_body = {
+        "title": "Learn PostgreSQL",
+        "description": "Because it's best DBMS",
+        "priority": 2,
+        "completed": True
+    }
+    client.put("/todos/1/update", json=request_body)
+    modified = client.get("/todos/1", headers={"If-None-Match": etag})
+    assert modified.status_code == status.HTTP_200_OK
+    assert modified.json()["version"] == 2
+    assert modified.headers["ETag"] != etag
+
+
+def test_get_todo_etag_not_reused_after_delete(test_user, test_todo):
+    request_body = {
+        "title": "Learn PostgreSQL",
+        "description": "Because it's best DBMS",
+        "priority": 3,
+        "completed": False
+    }
+    client.post("/todos/add", json=request_body)
+    etag = client.get("/todos/2").headers["ETag"]
+    client.delete("/todos/2/delete")
+
+    # SQLite hands the deleted id to the next insert.
+    client.post("/todos/add", json={**request_body, "title": "Learn Redis"})
+    response = client.get("/todos/2", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Learn Redis"
+    assert response.headers["ETag"] != etag
+
+
+def test_patch_todo(test_todo):
+    response = client.patch("/todos/1", json={"completed": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["completed"] is True
+    assert response.json()["data"]["title"] == test_todo.title
+    assert response.json()["data"]["version"] == 2
+    db = TestSessionLocal()
+    model = db.query(Todos).filter(Todos.id == 1).first()
+    assert model.completed is True
+    assert model.title == test_todo.title
+    assert model.priority == test_todo.priority
+    db.close()
+
+
+def test_patch_todo_invalid_field(test_todo):
+    response = client.patch("/todos/1", json={"priority": 9})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_patch_todo_empty(test_todo):
+    response = client.patch("/todos/1", json={})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "No fields to update"}
+
+
+def test_patch_todo_not_found(test_todo):
+    response = client.patch("/todos/999", json={"completed": True})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Todo not found"}
+
+
+def test_search_todos(test_todo):
+    db = TestSessionLocal()
+    db.add_all([
+        Todos(title="Learn PostgreSQL", description="Full text search with tsvector", priority=3, completed=False,
+              owner_id=1),
+        Todos(title="Buy milk", description="From the store", priority=1, completed=False, owner_id=1),
+        Todos(title="Learn search", description="Someone else's search", priority=1, completed=False, owner_id=2),
+    ])
+    db.commit()
+    db.close()
+
+    response = client.get("/todos/search", params={"q": "search"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in response.json()["data"]] == [2]
+
+    response = client.get("/todos/search", params={"q": "learn"})
+    assert [todo["id"] for todo in response.json()["data"]] == [1, 2]
+
+
+def test_search_todos_pagination(test_todo):
+    db = TestSessionLocal()
+    db.add_all([
+        Todos(title=f"Learn topic {i}", description="Study notes", priority=1, completed=False, owner_id=1)
+        for i in range(3)
+    ])
+    db.commit()
+    db.close()
+
+    first_page = client.get("/todos/search", params={"q": "learn", "limit": 3})
+    assert len(first_page.json()["data"]) == 3
+    second_page = client.get("/todos/search", params={"q": "learn", "limit": 3,
+                                                      "cursor": first_page.json()["next_cursor"]})
+    assert len(second_page.json()["data"]) == 1
+    assert second_page.json()["next_cursor"] is None
+    ids = [todo["id"] for todo in first_page.json()["data"] + second_page.json()["data"]]
+    assert sorted(ids) == [1, 2, 3, 4]
+
+
+def test_search_todos_follows_writes(test_todo):
+    client.patch("/todos/1", json={"title": "Master GraphQL"})
+    assert client.get("/todos/search", params={"q": "fastAPI"}).json()["data"] == []
+    assert [todo["id"] for todo in client.get("/todos/search", params={"q": "graphql"}).json()["data"]] == [1]
+
+    client.delete("/todos/1/delete")
+    assert client.get("/todos/search", params={"q": "graphql"}).json()["data"] == []
+
+
+def test_search_todos_quotes_syntax(test_todo):
+    response = client.get("/todos/search", params={"q": 'fastAPI" OR "'})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_get_todo_stats_follows_writes(test_todo):
+    client.post("/todos/bulk", json={"items": [
+        {"title": "Learn SQL", "description": "Joins", "priority": 3, "completed": False},
+        {"title": "Learn Redis", "description": "Caching", "priority": 3, "completed": True},
+    ]})
+    client.patch("/todos/2", json={"completed": True})
+    client.put("/todos/3/update", json={"title": "Learn Redis", "description": "Caching", "priority": 1,
+                                        "completed": True})
+    client.post("/todos/add", json={"title": "Learn Git", "description": "Rebase", "priority": 1,
+                                    "completed": False})
+    client.delete("/todos/4/delete")
+
+    response = client.get("/todos/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "total": 2,
+        "completed": 2,
+        "open": 0,
+        "by_priority": {"1": {"completed": 1, "open": 0}, "3": {"completed": 1, "open": 0}}
+    }
+
+
+def test_todo_endpoints_query_counts(test_todo):
+    with assert_max_queries(2):
+        client.get("/todos")
+    with assert_max_queries(1):
+        client.get("/todos")
+    with assert_max_queries(1):
+        client.get(f"/todos/{test_todo.id}")
+    with assert_max_queries(4):
+        client.post("/todos/add", json={"title": "Learn Git", "description": "Rebase", "priority": 1,
+                                        "completed": False})
+    with assert_max_queries(4):
+        client.patch("/todos/bulk", json={"items": [
+            {"id": test_todo.id, "title": "Learn SQL", "description": "Joins", "priority": 3, "completed": False},
+            {"id": 2, "title": "Learn Git", "description": "Rebase", "priority": 2, "completed": True},
+        ]})
+
+
+def test_get_changes_since(test_user, test_todo):
+    full = client.get("/todos/changes")
+    assert full.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in full.json()["changed"]] == [test_todo.id]
+    since = full.json()["version"]
+
+    client.post("/todos/add", json={"title": "Learn Git", "description": "Rebase", "priority": 1,
+                                    "completed": False})
+    client.patch(f"/todos/{test_todo.id}", json={"completed": True})
+    client.delete("/todos/2/delete")
+    response = client.get("/todos/changes", params={"since": since})
+    assert response.status_code == status.HTTP_200_OK
+    assert [(todo["id"], todo["completed"]) for todo in response.json()["changed"]] == [(test_todo.id, True)]
+    assert response.json()["deleted"] == [2]
+    assert response.json()["version"] == since + 3
+
+    response = client.get("/todos/changes", params={"since": response.json()["version"]})
+    assert response.json()["changed"] == []
+    assert response.json()["deleted"] == []
+
+
+def test_get_changes_full_sync_pages(test_user, test_todo):
+    client.post("/todos/add", json={"title": "Learn Git", "description": "Rebase", "priority": 1,
+                                    "completed": False})
+    first = client.get("/todos/changes", params={"limit": 1})
+    assert [todo["id"] for todo in first.json()["changed"]] == [test_todo.id]
+    version = first.json()["version"]
+
+    # A write between pages is left for the next sync instead of shifting the snapshot.
+    client.patch("/todos/2", json={"completed": True})
+    second = client.get("/todos/changes", params={"limit": 1, "cursor": first.json()["next_cursor"]})
+    assert second.json()["changed"] == []
+    assert second.json()["version"] == version
+    assert second.json()["next_cursor"] is None
+
+    response = client.get("/todos/changes", params={"since": version})
+    assert [(todo["id"], todo["completed"]) for todo in response.json()["changed"]] == [(2, True)]
+
+
+def test_get_changes_since_pages(test_user, test_todo):
+    since = client.get("/todos/changes").json()["version"]
+    for title in ("Learn Git", "Learn SQL", "Learn Redis"):
+        client.post("/todos/add", json={"title": title, "description": "Later", "priority": 1, "completed": False})
+    client.patch(f"/todos/{test_todo.id}", json={"completed": True})
+    client.delete("/todos/3/delete")
+
+    pages = []
+    params = {"since": since, "limit": 2}
+    while True:
+        response = client.get("/todos/changes", params=params)
+        assert len(response.json()["changed"]) + len(response.json()["deleted"]) <= 2
+        pages.append(response.json())
+        if response.json()["next_cursor"] is None:
+            break
+        params["cursor"] = response.json()["next_cursor"]
+
+    assert len(pages) == 2
+    assert pages[0]["version"] == since
+    assert pages[-1]["version"] == since + 5
+    assert [todo["id"] for page in pages for todo in page["changed"]] == [2, 4, test_todo.id]
+    assert [todo_id for page in pages for todo_id in page["deleted"]] == [3]
+
+
+def test_get_changes_after_compaction(test_user, test_todo):
+    since = client.get("/todos/changes").json()["version"]
+    client.delete(f"/todos/{test_todo.id}/delete")
+    assert client.get("/todos/changes", params={"since": since}).json()["deleted"] == [test_todo.id]
+
+    db = TestSessionLocal()
+    db.query(TodoTombstone).update({"deleted_at": datetime.now(timezone.utc) - timedelta(days=365)})
+    db.commit()
+    db.close()
+    assert client.post("/admin/changes/compact").json() == {"compacted": 1}
+
+    response = client.get("/todos/changes", params={"since": since})
+    assert response.status_code == status.HTTP_410_GONE
+    assert client.get("/todos/changes", params={"since": since + 1}).json()["deleted"] == []
@@ -1,9 +1,10 @@
 from fastapi import status
 
-from routers.user import get_current_user, get_db
+from routers.user import get_current_user, get_db, get_read_db
 from .utils import *
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 app.dependency_overrides[get_current_user] = override_get_current_user
 
 
@@ -23,10 +24,32 @@ def test_change_password(test_user):
     assert response.status_code == status.HTTP_204_NO_CONTENT
     db = TestSessionLocal()
     model = db.query(User).filter(User.id == 1).first()
-    assert bcrypt_context.verify("test123", model.hashed_password)
+    assert verify_password("test123", model.hashed_password)
     db.close()
 
 
+def test_change_password_revokes_refresh_tokens(test_user):
+    response = client.post("/auth/login", data={"username": test_user.email, "password": "admin123"},
+                           headers={"Content-Type": "application/x-www-form-urlencoded"})
+    refresh_token = response.json()["refresh_token"]
+
+    client.put("/user/change-password", json={"current_password": "admin123", "new_password": "test123"})
+    response = client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_change_password_concurrent_change_conflicts(test_user, monkeypatch):
+    async def change_password_meanwhile(db, user_id):
+        with TestSessionLocal() as other:
+            other.query(User).filter(User.id == user_id).update({"hashed_password": hash_password("other123", 4)})
+            other.commit()
+
+    monkeypatch.setattr("routers.user.revoke_refresh_tokens", change_password_meanwhile)
+    response = client.put("/user/change-password", json={"current_password": "admin123", "new_password": "test123"})
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json() == {"detail": "Password was changed by another request, try again"}
+
+
 def test_change_password_incorrect_password(test_user):
     response = client.put("/user/change-password", json={"current_password": "test123", "new_password": "test123"})
     assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -49,3 +72,22 @@ def test_change_profile(test_user):
     assert model.last_name == request_body["last_name"]
     assert model.phone_number == request_body["phone_number"]
     db.close()
+
+
+def test_get_user_not_modified(test_user):
+    response = client.get("/user")
+    etag = response.headers["ETag"]
+
+    not_modified = client.get("/user", headers={"If-None-Match": etag})
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+
+    request_body = {
+        "email": "fyan514@gmail.com",
+        "first_name": "Fyan",
+        "last_name": "Liu",
+        "phone_number": "1234567890",
+    }
+    client.put("/user/change-profile", json=request_body)
+    modified = client.get("/user", headers={"If-None-Match": etag})
+    assert modified.status_code == status.HTTP_200_OK
+    assert modified.json()["first_name"] == "Fyan"
@@ -1,27 +1,40 @@
+import asyncio
+import os
+import tempfile
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
-from database import Base
+from admission import auth_admission
+from cache import todo_list_cache
+from database import Base, attach_query_instrumentation, track_queries
 from api.main import app
-from models import Todos, User
-from routers.user import bcrypt_context
+from models import RefreshToken, Todos, TodoStats, TodoTombstone, User
+from hashing import hash_password, verify_password
+
+TEST_DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
 
-engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+engine = create_engine(f"sqlite:///{TEST_DATABASE_PATH}", connect_args={"check_same_thread": False})
 
 TestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", poolclass=NullPool)
+
+attach_query_instrumentation(async_engine.sync_engine)
+
+TestAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base.metadata.create_all(bind=engine)
 
 
-def override_get_db():
-    try:
-        db = TestSessionLocal()
+async def override_get_db():
+    async with TestAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def override_get_current_user():
@@ -31,10 +44,20 @@ def override_get_current_user():
 client = TestClient(app)
 
 
+@contextmanager
+def assert_max_queries(limit: int):
+    with track_queries() as stats:
+        yield stats
+    assert stats.count <= limit, f"{stats.count} queries, expected at most {limit}: {dict(stats.shapes)}"
+
+
 @pytest.fixture
 def test_todo():
+    asyncio.run(todo_list_cache.clear())
     db = TestSessionLocal()
     db.query(Todos).delete()
+    db.query(TodoStats).delete()
+    db.query(TodoTombstone).delete()
 
     todo = Todos(
         title="Learn fastAPI",
@@ -49,12 +72,15 @@ def test_todo():
     yield todo
 
     db.query(Todos).delete()
+    db.query(TodoStats).delete()
+    db.query(TodoTombstone).delete()
     db.commit()
     db.close()
 
 
 @pytest.fixture
 def test_user():
+    asyncio.run(auth_admission.clear())
     db = TestSessionLocal()
     db.query(User).delete()
 
@@ -64,7 +90,7 @@ def test_user():
         first_name="Ahmad",
         last_name="Sufyan",
         phone_number="087763324456",
-        hashed_password=bcrypt_context.hash("admin123"),
+        hashed_password=hash_password("admin123"),
         role="admin",
         is_active=True
     )
@@ -73,6 +99,7 @@ def test_user():
     db.refresh(user)
     yield user
 
+    db.query(RefreshToken).delete()
     db.query(User).delete()
     db.commit()
     db.close()
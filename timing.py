@@ -0,0 +1,103 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+
+# Prometheus' default histogram buckets, in seconds.
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+current_phases: ContextVar[Optional[dict]] = ContextVar("current_phases", default=None)
+
+
+def record_phase(phase: str, seconds: float):
+    """Adds `seconds` to `phase` of the request being served; a no-op outside a request."""
+    phases = current_phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed_phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        with timed_phase("serialize"):
+            return super().render(content)
+
+
+class PhaseHistograms:
+    """Cumulative Prometheus histograms of phase durations, labelled by method, route template and phase."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.series: dict[tuple[str, str, str], list] = {}
+
+    def observe(self, method: str, route: str, phase: str, seconds: float):
+        series = self.series.get((method, route, phase))
+        if series is None:
+            series = self.series[(method, route, phase)] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                counts[index] += 1
+        series[1] += seconds
+        series[2] += 1
+
+    def render(self, name: str = "todo_api_request_phase_seconds") -> str:
+        lines = [
+            f"# HELP {name} Time spent in each phase of a request, by route.",
+            f"# TYPE {name} histogram",
+        ]
+        for (method, route, phase), (counts, total, count) in sorted(self.series.items()):
+            labels = f'method="{method}",route="{route}",phase="{phase}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+phase_histograms = PhaseHistograms()
+
+
+class ServerTimingMiddleware:
+    """Collects per-phase durations for each request, reports them in a Server-Timing header and
+    feeds phase_histograms. Requests that match no route are not recorded, to bound label cardinality."""
+
+    def __init__(self, app, histograms: PhaseHistograms = phase_histograms):
+        self.app = app
+        self.histograms = histograms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases = {}
+        token = current_phases.set(phases)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                phases["total"] = time.perf_counter() - started
+                header = ", ".join(f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in phases.items())
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_phases.reset(token)
+            route = scope.get("route")
+            if route is not None and "total" in phases:
+                for phase, seconds in phases.items():
+                    self.histograms.observe(scope["method"], route.path, phase, seconds)
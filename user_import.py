@@ -0,0 +1,149 @@
+import csv
+import json
+import os
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from hashing import hash_passwords_parallel, hashing_policy
+from models import User
+from routers.auth import CreateUserRequest
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", "65536"))
+
+
+async def read_lines(chunks):
+    """Splits an async byte stream into decoded lines, holding at most one partial line in memory."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Line too long")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def parse_rows(lines, import_format: str):
+    """Yields (row number, CreateUserRequest or None, error detail) per non-blank data row.
+
+    CSV rows are parsed line by line, so quoted fields may not contain newlines.
+    """
+    header = None
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        if import_format == "csv" and header is None:
+            header = next(csv.reader([line]))
+            continue
+        row_number += 1
+        try:
+            if import_format == "csv":
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+                row = dict(zip(header, values))
+            else:
+                row = json.loads(line)
+            yield row_number, CreateUserRequest.model_validate(row), None
+        except ValidationError as error:
+            yield row_number, None, "; ".join(
+                f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors()
+            )
+        except ValueError as error:
+            yield row_number, None, str(error)
+
+
+async def import_users(db: AsyncSession, chunks, import_format: str, report) -> dict:
+    """Imports users from an uploaded CSV/NDJSON stream in batches, writing one NDJSON report line per row
+    to the binary file `report`, then a summary line. Each batch is committed on its own."""
+    summary = {"created": 0, "duplicate": 0, "invalid": 0}
+    batch = []
+    async for row in parse_rows(read_lines(chunks), import_format):
+        batch.append(row)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await import_batch(db, batch, report, summary)
+            batch = []
+    if batch:
+        await import_batch(db, batch, report, summary)
+    report.write(json.dumps({"summary": summary}).encode() + b"\n")
+    return summary
+
+
+async def import_batch(db: AsyncSession, batch: list, report, summary: dict):
+    requests = [(row_number, request) for row_number, request, _ in batch if request is not None]
+    results = {row_number: {"status": "invalid", "detail": detail} for row_number, request, detail in batch
+               if request is None}
+    # A concurrent registration can take an email between the duplicate check and the INSERT; the unique
+    # constraint then rejects the batch, and a second pass sees that row as a duplicate. Hashes are kept by
+    # row, so the retry only inserts the rows still in `created` without hashing them again.
+    hashed_passwords = {}
+    for attempt in range(2):
+        created, duplicates = await split_duplicates(db, requests)
+        unhashed = [(row_number, request) for row_number, request in created if row_number not in hashed_passwords]
+        hashed_passwords.update(zip(
+            [row_number for row_number, _ in unhashed],
+            await hash_passwords_parallel([request.password for _, request in unhashed], hashing_policy.rounds)
+        ))
+        try:
+            if created:
+                await db.execute(insert(User).values([
+                    {
+                        "email": request.email,
+                        "username": request.username,
+                        "first_name": request.first_name,
+                        "last_name": request.last_name,
+                        "phone_number": request.phone_number,
+                        "hashed_password": hashed_passwords[row_number],
+                        "role": request.role or "user",
+                        "is_active": True,
+                    }
+                    for row_number, request in created
+                ]))
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            if attempt:
+                raise
+    for row_number, _ in created:
+        results[row_number] = {"status": "created"}
+    for row_number, _ in duplicates:
+        results[row_number] = {"status": "duplicate"}
+
+    for row_number, _, _ in batch:
+        result = results[row_number]
+        summary[result["status"]] += 1
+        report.write(json.dumps({"row": row_number, **result}).encode() + b"\n")
+
+
+async def split_duplicates(db: AsyncSession, requests: list) -> tuple[list, list]:
+    """Separates rows whose email or username is already taken, in this batch or in one query against users."""
+    result = await db.execute(
+        select(User.email, User.username).where(or_(
+            User.email.in_({request.email for _, request in requests}),
+            User.username.in_({request.username for _, request in requests})
+        ))
+    )
+    taken = set()
+    for email, username in result.all():
+        taken.add(("email", email))
+        taken.add(("username", username))
+
+    created, duplicates = [], []
+    for row_number, request in requests:
+        keys = {("email", request.email), ("username", request.username)}
+        if keys & taken:
+            duplicates.append((row_number, request))
+        else:
+            created.append((row_number, request))
+            taken |= keys
+    return created, duplicates